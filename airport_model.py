@@ -0,0 +1,398 @@
+import bisect
+import collections
+import itertools
+from typing import List, Dict, Any
+
+import numpy as np
+
+from streaming_stats import RunningStats, QuantileSketch
+
+
+class VariateBuffer(object):
+    """
+    Поток случайных величин одного назначения. Значения генерируются NumPy
+    блоками (от MIN_BLOCK с удвоением до MAX_BLOCK) и выдаются по одному
+    через итератор, так что розыгрыш одной величины - вызов на C без кадра Python.
+    Равномерные и экспоненциальные величины идут из отдельных последовательностей
+    блоков, поэтому поток следует использовать для величин одного вида.
+    Значения не зависят от размера блоков и совпадают с массивами, которые
+    тот же генератор выдал бы за один вызов (см. vector_engine).
+    """
+
+    MIN_BLOCK = 1024
+    MAX_BLOCK = 65536
+
+    def __init__(self, seed_seq: np.random.SeedSequence):
+        generator = np.random.default_rng(seed_seq)
+        # random() и standard_exponential() - следующие значения из блоков
+        self.random = self._supply(generator.random)
+        self.standard_exponential = self._supply(generator.standard_exponential)
+
+    @classmethod
+    def _supply(cls, draw):
+        def blocks():
+            size = cls.MIN_BLOCK
+            while True:
+                yield draw(size).tolist()
+                size = min(size * 2, cls.MAX_BLOCK)
+        return itertools.chain.from_iterable(blocks()).__next__
+
+    def expovariate(self, lambd: float) -> float:
+        return self.standard_exponential() / lambd
+
+
+class RandomStreams(object):
+    """
+    Независимые генераторы запуска, по одному на каждое назначение: прибытия,
+    число мест багажа, маршрутизация и время обслуживания на каждой станции.
+
+    Поток назначения k порождается из зерна запуска как
+    SeedSequence(seed, spawn_key=(k,)), k - позиция в PURPOSES; для назначений
+    вне PURPOSES (этапы, добавленные через 'route') spawn_key - байты имени.
+    Поскольку все характеристики пассажира разыгрываются при его появлении в
+    порядке номеров, два запуска с одним зерном видят одних и тех же пассажиров
+    даже при разном числе ресурсов (common random numbers). Потоки - буферы
+    VariateBuffer над генераторами NumPy этих SeedSequence.
+    """
+
+    PURPOSES = ('arrival', 'bags', 'routing', 'registration', 'security', 'customs',
+                'duty_free', 'restaurant', 'toilet', 'boarding')
+
+    def __init__(self, seed: int = None):
+        self.seed = seed
+        self._streams = {}
+        for purpose in self.PURPOSES:
+            setattr(self, purpose, self.stream(purpose))
+
+    def seed_sequence(self, purpose: str) -> np.random.SeedSequence:
+        """SeedSequence потока purpose; из нее же строят генераторы NumPy (vector_engine)."""
+        if purpose in self.PURPOSES:
+            spawn_key = (self.PURPOSES.index(purpose),)
+        else:
+            spawn_key = (len(self.PURPOSES),) + tuple(purpose.encode('utf-8'))
+        return np.random.SeedSequence(self.seed, spawn_key=spawn_key)
+
+    def stream(self, purpose: str) -> VariateBuffer:
+        """Генератор для назначения purpose (создается при первом обращении)."""
+        if purpose not in self._streams:
+            self._streams[purpose] = VariateBuffer(self.seed_sequence(purpose))
+        return self._streams[purpose]
+
+
+# Описание этапа маршрута: ресурс, вероятность посещения, ключ и интервал
+# равномерного времени обслуживания, доп. время на место багажа, слот метрики
+StageSpec = collections.namedtuple(
+    'StageSpec', 'name resource probability service_key service_time per_bag metric')
+
+# Параметры этапов по умолчанию; probability=None означает обязательный этап
+STAGE_DEFAULTS = {
+    'registration': {'probability': None, 'default_time': (1, 2), 'per_bag': 1},
+    'toilet_before': {'probability': 0.2, 'service_time': 'toilet', 'default_time': (2, 5), 'metric': 'toilet'},
+    'security': {'probability': None, 'default_time': (1, 5)},
+    'customs': {'probability': 0.7, 'default_time': (1, 6)},
+    'duty_free': {'probability': 0.1, 'default_time': (5, 15)},
+    'restaurant': {'probability': 0.33, 'default_time': (10, 45)},
+    'toilet_after': {'probability': 0.2, 'service_time': 'toilet', 'default_time': (2, 5), 'metric': 'toilet'},
+    'boarding': {'probability': None, 'default_time': (20 / 60, 2)},
+}
+
+DEFAULT_ROUTE = ('registration', 'toilet_before', 'security', 'customs',
+                 'duty_free', 'restaurant', 'toilet_after', 'boarding')
+
+
+def build_route(params: Dict[str, Any]) -> List[StageSpec]:
+    """
+    Компилирует маршрут пассажира из params['route'] (по умолчанию DEFAULT_ROUTE).
+
+    Элемент маршрута - имя этапа или словарь с ключом 'name' и необязательными
+    'resource', 'probability', 'service_time' (ключ в params['service_times']),
+    'per_bag' и 'metric'. Если не указано иное, этап использует ресурс, время
+    обслуживания и слот метрики со своим именем, а вероятность посещения берется
+    из params['probabilities'].
+    """
+    probabilities = params.get('probabilities', {})
+    service_times = params.get('service_times', {})
+
+    route = []
+    for item in params.get('route', DEFAULT_ROUTE):
+        spec = item if isinstance(item, dict) else {'name': item}
+        name = spec['name']
+        defaults = STAGE_DEFAULTS.get(name, {})
+        probability = spec.get('probability', probabilities.get(name, defaults.get('probability')))
+        service_key = spec.get('service_time', defaults.get('service_time', name))
+        service_time = service_times.get(service_key, defaults.get('default_time'))
+        if service_time is None:
+            raise ValueError(f"Не задано время обслуживания '{service_key}' для этапа '{name}'")
+        route.append(StageSpec(
+            name=name,
+            resource=spec.get('resource', name),
+            probability=1.0 if probability is None else probability,
+            service_key=service_key,
+            service_time=tuple(service_time),
+            per_bag=spec.get('per_bag', defaults.get('per_bag', 0)),
+            metric=spec.get('metric', defaults.get('metric', name)),
+        ))
+    return route
+
+
+def route_resource_counts(params: Dict[str, Any], route: List[StageSpec]) -> Dict[str, int]:
+    """Число каналов каждого ресурса маршрута route из params['resources']."""
+    return {spec.resource: params['resources'][spec.resource] for spec in route}
+
+
+def make_passenger_sampler(route: List[StageSpec], streams: RandomStreams):
+    """
+    Возвращает функцию без аргументов, разыгрывающую все характеристики
+    очередного пассажира при его появлении: число мест багажа, посещаемые
+    этапы и длительности обслуживания. Результат - кортеж длительностей по
+    этапам маршрута, None - этап пропускается. Все движки используют одну и ту
+    же функцию, поэтому при одном зерне видят одних и тех же пассажиров.
+    """
+    bags = streams.bags.random
+    routing = streams.routing.random
+    # Равномерное время обслуживания - low + width * random()
+    stages = [(spec.probability, spec.per_bag, spec.service_time[0],
+               spec.service_time[1] - spec.service_time[0], streams.stream(spec.service_key).random)
+              for spec in route]
+
+    def draw_passenger():
+        num_bags = int(bags() * 4)  # равномерно на {0, 1, 2, 3}
+        return tuple([low + width * sampler() + num_bags * per_bag
+                      if probability >= 1 or routing() < probability else None
+                      for probability, per_bag, low, width, sampler in stages])
+
+    return draw_passenger
+
+
+# Процентили времени пребывания пассажира в статистике запуска (wait_time_pNN)
+WAIT_PERCENTILES = (50, 90, 95, 99)
+
+
+class StageStats(object):
+    """
+    Накопители одного этапа маршрута: длительности завершенных обслуживаний,
+    число начатых обслуживаний, ожидание в очереди перед ними и число ушедших
+    с этого этапа по таймауту. Движки добавляют в queue_wait только ненулевые
+    ожидания встававших в очередь; нули для остальных дописывает finish().
+    """
+
+    __slots__ = ('service', 'started', 'queue_wait', 'reneged')
+
+    def __init__(self):
+        self.service = RunningStats()
+        self.started = 0
+        self.queue_wait = QuantileSketch()
+        self.reneged = 0
+
+    def finish(self) -> None:
+        """Учитывает нулевое ожидание пассажиров, сразу заставших свободный канал."""
+        unqueued = self.started - self.queue_wait.count
+        if unqueued > 0:
+            self.queue_wait.add(0.0, unqueued)
+
+    def merge(self, other: 'StageStats') -> None:
+        """Добавляет накопители того же этапа за другой отрезок времени."""
+        self.service.merge(other.service)
+        self.started += other.started
+        self.queue_wait.merge(other.queue_wait)
+        self.reneged += other.reneged
+
+    def summary(self) -> Dict[str, Any]:
+        self.finish()
+        return {
+            'queue_wait_mean': self.queue_wait.mean,
+            'queue_wait_p95': self.queue_wait.quantile(0.95),
+            'service_mean': self.service.mean,
+            'renege_count': self.reneged,
+        }
+
+
+class RunStatistics(object):
+    """
+    Счетчики и накопители одного запуска, общие для всех движков: время
+    пребывания обслуженных пассажиров, накопители этапов (StageStats)
+    и число сгенерированных, обслуженных и ушедших пассажиров.
+    """
+
+    def __init__(self, route: List[StageSpec], resource_counts: Dict[str, int]):
+        self.wait_stats = RunningStats()  # общее время пребывания обслуженных пассажиров
+        self.wait_sketch = QuantileSketch()  # его распределение для процентилей
+        self.total_generated_passengers = 0
+        self.served_passengers = 0
+        self.rejected_passengers = 0
+        self.timeout_passengers = 0
+
+        # Накопители этапов (в порядке маршрута) и количество ресурсов по слотам метрик
+        self.route = route
+        self.stages = [StageStats() for _ in route]
+        self.resource_counts = {}
+        self.resource_metric = {}
+        for spec in route:
+            if spec.resource not in self.resource_metric:
+                self.resource_metric[spec.resource] = spec.metric
+                self.resource_counts[spec.metric] = (self.resource_counts.get(spec.metric, 0)
+                                                     + resource_counts[spec.resource])
+
+        # Интегралы по времени до конца моделирования, заполняются движком:
+        # число пассажиров в системе, занятые каналы и длина очереди по ресурсам
+        self.capacity = {name: resource_counts[name] for name in self.resource_metric}
+        self.presence_time = 0.0
+        self.busy_time = dict.fromkeys(self.resource_metric, 0.0)
+        self.queue_time = dict.fromkeys(self.resource_metric, 0.0)
+        self.max_queue = dict.fromkeys(self.resource_metric, 0)
+        # Начало интервала, к которому относятся накопители (конец - аргумент calculate_statistics)
+        self.since = 0.0
+
+    def merge(self, other: 'RunStatistics') -> None:
+        """Добавляет накопители того же маршрута за другой отрезок времени (см. RunSlices)."""
+        self.wait_stats.merge(other.wait_stats)
+        self.wait_sketch.merge(other.wait_sketch)
+        self.total_generated_passengers += other.total_generated_passengers
+        self.served_passengers += other.served_passengers
+        self.rejected_passengers += other.rejected_passengers
+        self.timeout_passengers += other.timeout_passengers
+        for stage, part in zip(self.stages, other.stages):
+            stage.merge(part)
+        self.presence_time += other.presence_time
+        for name in self.resource_metric:
+            self.busy_time[name] += other.busy_time[name]
+            self.queue_time[name] += other.queue_time[name]
+            self.max_queue[name] = max(self.max_queue[name], other.max_queue[name])
+
+    def calculate_statistics(self, simulation_time: float):
+        """Расчет статистики системы с корректной утилизацией"""
+        if not self.wait_stats.count:
+            return None
+        span = simulation_time - self.since  # длина учитываемого интервала
+
+        served_passengers = self.served_passengers
+        avg_wait_time = self.wait_stats.mean
+        avg_passengers_in_system = self.presence_time / span
+
+        # Коэффициент использования для каждого типа ресурса: доля времени
+        # занятости каналов, включая обслуживания, не завершенные к концу моделирования
+        busy_by_metric = {}
+        for name, metric in self.resource_metric.items():
+            busy_by_metric[metric] = busy_by_metric.get(metric, 0.0) + self.busy_time[name]
+        utilization = {}
+        for service in dict.fromkeys(spec.metric for spec in self.route):
+            if service in self.resource_counts:
+                total_possible_time = span * self.resource_counts[service]
+                utilization[service] = busy_by_metric[service] / total_possible_time if total_possible_time > 0 else 0.0
+            else:
+                utilization[service] = 0.0
+
+        # Показатели каждого ресурса по отдельности
+        resources = {}
+        for name, capacity in self.capacity.items():
+            resources[name] = {
+                'utilization': self.busy_time[name] / (span * capacity) if capacity > 0 else 0.0,
+                'avg_queue_length': self.queue_time[name] / span,
+                'max_queue_length': self.max_queue[name],
+            }
+
+        # Абсолютная пропускная способность (пассажиров в час)
+        absolute_throughput = (served_passengers / span) * 60
+
+        # Относительная пропускная способность
+        total_passengers = served_passengers + self.rejected_passengers
+        relative_throughput = served_passengers / total_passengers if total_passengers > 0 else 0
+
+        # Отношение обработанных пассажиров
+        total_generated = self.total_generated_passengers
+        served_ratio = served_passengers / total_generated if total_generated > 0 else 0
+
+        # Процентили времени пребывания по гистограмме
+        stats = {'avg_wait_time': avg_wait_time}
+        for q in WAIT_PERCENTILES:
+            stats[f'wait_time_p{q}'] = self.wait_sketch.quantile(q / 100)
+
+        stats.update({
+            'avg_passengers_in_system': avg_passengers_in_system,
+            'utilization': utilization,
+            'resources': resources,
+            'stages': {spec.name: stage.summary() for spec, stage in zip(self.route, self.stages)},
+            'absolute_throughput': absolute_throughput,
+            'relative_throughput': relative_throughput,
+            'generated_passengers': total_generated,
+            'served_ratio': served_ratio,
+            'served_passengers': served_passengers,
+            'rejected_passengers': self.rejected_passengers,
+            'timeout_passengers': self.timeout_passengers,
+            # Сама гистограмма, чтобы процентили можно было объединять между запусками
+            'wait_time_sketch': self.wait_sketch.to_dict(),
+        })
+        return stats
+
+
+class RunSlices(object):
+    """
+    Статистика запуска по отрезкам времени [0, bounds[0]), [bounds[0], bounds[1]), ...;
+    последняя граница - конец моделирования. У каждого отрезка свой
+    RunStatistics (parts[j]): движок пишет события в накопители отрезка, на
+    котором они произошли, а интегралы по времени (занятость каналов, длина
+    очереди, число пассажиров в системе) распределяет по отрезкам через spread;
+    наибольшую очередь каждого отрезка движок отсчитывает от очереди в его
+    начале. Поэтому один запуск дает статистику за любой ряд соседних
+    отрезков (statistics): так отбрасывается разогрев, в том числе выбранный
+    уже после запуска, и считаются групповые средние.
+    """
+
+    def __init__(self, route: List[StageSpec], resource_counts: Dict[str, int], bounds: List[float]):
+        self.route = route
+        self.resource_counts = resource_counts
+        self.bounds = [float(bound) for bound in bounds]
+        self.starts = [0.0] + self.bounds[:-1]
+        self.parts = []
+        for start in self.starts:
+            part = RunStatistics(route, resource_counts)
+            part.since = start
+            self.parts.append(part)
+
+    @classmethod
+    def uniform(cls, route: List[StageSpec], resource_counts: Dict[str, int], horizon: float,
+                count: int, since: float = 0.0) -> 'RunSlices':
+        """count равных отрезков [since, horizon], перед ними при since > 0 - отрезок [0, since)."""
+        bounds = [since + (horizon - since) * j / count for j in range(1, count)] + [horizon]
+        if since > 0:
+            bounds.insert(0, since)
+        return cls(route, resource_counts, bounds)
+
+    def spread(self, totals, key, start: float, end: float) -> None:
+        """
+        Добавляет к totals[j][key] длину пересечения интервала [start, end]
+        с каждым отрезком j; totals - накопители отрезков по порядку (например,
+        [part.busy_time for part in parts]). Часть интервала после конца
+        моделирования не учитывается.
+        """
+        bounds, starts = self.bounds, self.starts
+        j = bisect.bisect_right(bounds, start)
+        if j < len(bounds) and end <= bounds[j]:
+            # Обычный случай: интервал целиком внутри одного отрезка
+            if end > start:
+                totals[j][key] += end - start
+            return
+        for j in range(j, len(bounds)):
+            low = starts[j]
+            if low >= end:
+                break
+            high = bounds[j]
+            overlap = (end if end < high else high) - (start if start > low else low)
+            if overlap > 0:
+                totals[j][key] += overlap
+
+    def merged(self, first: int = 0, last: int = None) -> RunStatistics:
+        """Накопители отрезков first..last-1 (по умолчанию - до конца) как один RunStatistics."""
+        last = len(self.parts) if last is None else last
+        if last - first == 1:
+            return self.parts[first]
+        merged = RunStatistics(self.route, self.resource_counts)
+        merged.since = self.starts[first]
+        for part in self.parts[first:last]:
+            merged.merge(part)
+        return merged
+
+    def statistics(self, first: int = 0, last: int = None) -> Dict[str, Any]:
+        """Статистика за отрезки first..last-1 (см. RunStatistics.calculate_statistics)."""
+        last = len(self.parts) if last is None else last
+        return self.merged(first, last).calculate_statistics(self.bounds[last - 1])
@@ -1,9 +1,28 @@
 import simpy
-import random
+import bisect
 import statistics
 import json
 import itertools
-from typing import List, Dict, Any
+import math
+import operator
+import collections
+import functools
+import hashlib
+import os
+import multiprocessing
+import multiprocessing.connection
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterator
+
+from streaming_stats import (RunningStats, TimeWeighted, QuantileSketch, BatchSeries,
+                             mser_truncation, batch_means_interval)
+from airport_model import (RandomStreams, RunSlices, WAIT_PERCENTILES, build_route,
+                           route_resource_counts, make_passenger_sampler)
+from fast_engine import run_fast
+from vector_engine import run_vector
+from analytic_screen import screen_config
 
 
 def load_params_from_json(json_file_path: str) -> Dict[str, Any]:
@@ -12,349 +31,773 @@ def load_params_from_json(json_file_path: str) -> Dict[str, Any]:
     return params
 
 
-def run_simulation_with_params(params: Dict[str, Any]):
+def new_root_seed() -> int:
+    """Случайное корневое зерно из энтропии ОС (используется, если зерно не задано)."""
+    return int(np.random.SeedSequence().generate_state(1, np.uint64)[0])
+
+
+def derive_run_seed(root_seed: int, config_key: int, run_id: int) -> int:
     """
-    Запуск симуляции с заданными параметрами.
+    Зерно отдельного запуска.
+
+    Из корневого зерна порождается SeedSequence с spawn_key=(config_key, run_id),
+    и первое 64-битное слово ее состояния становится зерном запуска. Поэтому
+    потоки разных пар (конфигурация, повтор) независимы, не зависят от порядка
+    и числа процессов, а любой запуск воспроизводится по записанному зерну:
+    run_simulation_with_params(params, seed).
+
+    config_key - номер эксперимента в batch или, в grid search, ключ
+    содержимого конфигурации (config_seed_key). Во втором случае зерно не
+    зависит от положения комбинации в grid: после добавления значения в
+    grid_config.json прежние комбинации получают те же зерна и берутся из
+    кэша результатов, если корневое зерно то же.
     """
-    wait_times = []
-    total_generated_passengers = 0
-    served_passengers = 0
-    rejected_passengers = 0
-    timeout_passengers = 0
-
-    MAX_WAIT_TIME = params.get('max_time', 180)
-    SIMULATION_TIME = params.get('simulation_time', 480)  # Default 8 hours
-    INITIAL_PASSENGERS = params.get('initial_passengers', 100)
-
-    # Resource counts
-    num_registration_agents = params['resources']['registration']
-    num_security_agents = params['resources']['security']
-    num_customs_agents = params['resources']['customs']
-    num_duty_free_cashiers = params['resources']['duty_free']
-    num_restaurant_tables = params['resources']['restaurant']
-    num_toilets_before = params['resources']['toilet_before']
-    num_toilets_after = params['resources']['toilet_after']
-    num_boarding_gates = params['resources']['boarding']
-
-    # Probabilities
-    prob_customs = params['probabilities'].get('customs', 0.7)
-    prob_duty_free = params['probabilities'].get('duty_free', 0.1)
-    prob_restaurant = params['probabilities'].get('restaurant', 0.33)
-    prob_toilet_before = params['probabilities'].get('toilet_before', 0.2)
-    prob_toilet_after = params['probabilities'].get('toilet_after', 0.2)
-
-    # Service times (min, max tuples)
-    service_times = params.get('service_times', {})
-    reg_time = service_times.get('registration', (1, 2))
-    sec_time = service_times.get('security', (1, 5))
-    customs_time = service_times.get('customs', (1, 6))
-    duty_free_time = service_times.get('duty_free', (5, 15))
-    restaurant_time = service_times.get('restaurant', (10, 45))
-    toilet_time = service_times.get('toilet', (2, 5))
-    boarding_time = service_times.get('boarding', (20 / 60, 2))
-
-    passenger_arrival_rate = params['passenger_arrival_rate']
-
-    class Airport(object):
-        """Класс для моделирования аэропорта с различными ресурсами обслуживания"""
-
-        def __init__(self, env, num_registration_agents,
-                     num_security_agents, num_customs_agents,
-                     num_duty_free_cashiers, num_restaurant_tables,
-                     num_toilets_before, num_toilets_after, num_boarding_gates):
-            self.env = env
-            self.registration = simpy.Resource(env, num_registration_agents)
-            self.security = simpy.Resource(env, num_security_agents)
-            self.customs = simpy.Resource(env, num_customs_agents)
-            self.duty_free = simpy.Resource(env, num_duty_free_cashiers)
-            self.restaurant = simpy.Resource(env, num_restaurant_tables)
-            self.toilet_before = simpy.Resource(env, num_toilets_before)
-            self.toilet_after = simpy.Resource(env, num_toilets_after)
-            self.boarding_gate = simpy.Resource(env, num_boarding_gates)
-
-            # Сохраняем объекты ресурсов для расчета утилизации
-            self.resources = {
-                'registration': self.registration,
-                'security': self.security,
-                'customs': self.customs,
-                'duty_free': self.duty_free,
-                'restaurant': self.restaurant,
-                'toilet': (self.toilet_before, self.toilet_after),
-                'boarding': self.boarding_gate
-            }
-
-            # Сохраняем количество ресурсов для расчета утилизации
-            self.resource_counts = {
-                'registration': num_registration_agents,
-                'security': num_security_agents,
-                'customs': num_customs_agents,
-                'duty_free': num_duty_free_cashiers,
-                'restaurant': num_restaurant_tables,
-                'toilet': num_toilets_before + num_toilets_after,
-                'boarding': num_boarding_gates
-            }
-
-        def register_passenger(self, passenger):
-            """Регистрация пассажира и багажа (мин + 1 * каждое место багажа)"""
-            num_bags = random.randint(0, 3)
-            service_time = random.uniform(*reg_time) + num_bags * 1
-            yield self.env.timeout(service_time)
-
-        def check_security(self, passenger):
-            """Проверка безопасности"""
-            service_time = random.uniform(*sec_time)
-            yield self.env.timeout(service_time)
-
-        def check_customs(self, passenger):
-            """Таможенная проверка"""
-            service_time = random.uniform(*customs_time)
-            yield self.env.timeout(service_time)
-
-        def visit_duty_free(self, passenger):
-            """Покупки в Duty Free"""
-            service_time = random.uniform(*duty_free_time)
-            yield self.env.timeout(service_time)
-
-        def use_restaurant(self, passenger):
-            """Посещение ресторана"""
-            service_time = random.uniform(*restaurant_time)
-            yield self.env.timeout(service_time)
-
-        def use_toilet(self, passenger):
-            """Посещение туалета"""
-            service_time = random.uniform(*toilet_time)
-            yield self.env.timeout(service_time)
-
-        def board_flight(self, passenger):
-            """Посадка на рейс"""
-            service_time = random.uniform(*boarding_time)
-            yield self.env.timeout(service_time)
-
-    service_durations = {
-        'registration': [],
-        'security': [],
-        'customs': [],
-        'duty_free': [],
-        'restaurant': [],
-        'toilet': [], # Combined
-        'boarding': []
-    }
+    seed_seq = np.random.SeedSequence(root_seed, spawn_key=(config_key, run_id))
+    return int(seed_seq.generate_state(1, np.uint64)[0])
+
+
+class DeadlineWatcher(object):
+    """
+    Единственный процесс, отвечающий за уход пассажиров по таймауту (max_time).
+
+    Пассажир регистрирует свой дедлайн один раз при появлении и получает билет
+    [дедлайн, процесс, запрос в очереди]. Так как max_time у всех одинаков,
+    дедлайны поступают в неубывающем порядке и хранятся в deque. В куче событий
+    живет не более одного таймера наблюдателя - до дедлайна самого раннего
+    пассажира, который еще в системе; билеты ушедших пассажиров просто
+    пропускаются. Если к дедлайну пассажир стоит в очереди, его процесс
+    прерывается; если он в этот момент обслуживается, уход фиксируется при
+    попытке встать в следующую очередь.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.tickets = collections.deque()
+        self._idle = None
+        env.process(self._watch())
+
+    def watch(self, deadline):
+        """Регистрирует активный процесс пассажира и возвращает его билет."""
+        ticket = [deadline, self.env.active_process, None]
+        self.tickets.append(ticket)
+        if self._idle is not None:
+            self._idle.succeed()
+            self._idle = None
+        return ticket
+
+    def _watch(self):
+        env, tickets = self.env, self.tickets
+        while True:
+            if not tickets:
+                self._idle = env.event()
+                yield self._idle
+                continue
+            ticket = tickets[0]
+            if ticket[1] is None:
+                # Пассажир уже покинул систему
+                tickets.popleft()
+            elif ticket[0] > env.now:
+                yield env.timeout(ticket[0] - env.now)
+            else:
+                tickets.popleft()
+                request = ticket[2]
+                if request is not None and not request.triggered:
+                    ticket[1].interrupt('timeout')
 
-    def passenger_journey(env, passenger_id, airport):
-        """Процесс прохождения пассажира через аэропорт с отслеживанием длительности обслуживания"""
-        nonlocal served_passengers, rejected_passengers, timeout_passengers
 
+def reneging_enabled(params: Dict[str, Any]) -> bool:
+    """
+    Нужна ли в запуске логика ухода по таймауту. params['reneging'] (true/false)
+    задает режим явно; по умолчанию ('auto') уход отключается, если
+    max_time >= simulation_time: дедлайн любого пассажира тогда наступает не
+    раньше конца моделирования и сработать не может.
+    """
+    mode = params.get('reneging', 'auto')
+    if mode != 'auto':
+        return bool(mode)
+    return params.get('max_time', 180) < params.get('simulation_time', 480)
+
+
+class MonitoredResource(simpy.Resource):
+    """
+    Ресурс SimPy, сообщающий длину своей очереди: ожидание запроса
+    распределяется по отрезкам RunSlices (в накопители queue_time под именем
+    ресурса) при выходе из очереди - начале обслуживания или уходе, а
+    запросы, оставшиеся в очереди к концу моделирования, учитывает finish().
+    Так пассажир, заставший свободный канал, обходится без лишних вызовов.
+    Наибольшая очередь считается с начала текущего отрезка (snapshot).
+    """
+
+    def __init__(self, env, capacity: int, name: str, slices: RunSlices):
+        super().__init__(env, capacity)
+        self.name = name
+        self.slices = slices
+        self.queue_totals = [part.queue_time for part in slices.parts]
+        self.max_queue = 0
+
+    def enqueue(self, request) -> bool:
+        """
+        Отмечает постановку запроса request в очередь, если он не удовлетворен
+        сразу; возвращает, встал ли запрос в очередь.
+        """
+        if request.triggered:
+            return False
+        request.queued_at = self._env.now
+        if len(self.put_queue) > self.max_queue:
+            self.max_queue = len(self.put_queue)
+        return True
+
+    def dequeue(self, request, now: float) -> None:
+        """Запрос request, стоявший в очереди, покинул ее в момент now."""
+        self.slices.spread(self.queue_totals, self.name, request.queued_at, now)
+
+    def snapshot(self) -> int:
+        """Конец отрезка: возвращает наибольшую очередь на нем и начинает отсчет от текущей."""
+        peak = self.max_queue
+        self.max_queue = len(self.put_queue)
+        return peak
+
+    def finish(self, horizon: float) -> None:
+        """Добавляет ожидание запросов, стоящих в очереди в момент horizon."""
+        for request in self.put_queue:
+            self.dequeue(request, horizon)
+
+
+# Диагностика движка SimPy. Публичного доступа к куче событий и счетчику
+# идентификаторов событий в SimPy нет, поэтому внутренние атрибуты
+# Environment._queue и Environment._eid читаются только в этих двух функциях.
+
+def simpy_event_queue_size(env) -> int:
+    """Текущий размер кучи событий окружения env."""
+    return len(env._queue)
+
+
+def simpy_event_count(env) -> int:
+    """
+    Число событий, запланированных в env с начала запуска (следующий
+    идентификатор события). Вызывается после окончания запуска: взятый
+    при этом идентификатор уже не понадобится.
+    """
+    return next(env._eid)
+
+
+# Этап, связанный с объектами запуска SimPy: номер в маршруте и ресурс
+Stage = collections.namedtuple('Stage', 'name index resource')
+
+
+class Airport(object):
+    """
+    Класс для моделирования аэропорта с различными ресурсами обслуживания.
+    Хранит состояние одного запуска модели AirportModel: окружение SimPy,
+    ресурсы, потоки случайных чисел и статистику запуска по отрезкам времени
+    (RunSlices): self.stats - накопители текущего отрезка, их переключает
+    процесс slice_clock. В completions (BatchSeries), если он передан,
+    записываются (completions.add) момент и время пребывания обслуженных
+    пассажиров.
+    """
+
+    def __init__(self, env, model, streams, slices: RunSlices, completions=None):
+        self.env = env
+        self.model = model
+        self.streams = streams
+        self.slices = slices
+        self.completions = completions
+        self.watcher = DeadlineWatcher(env) if model.reneging else None
+        self.part = 0
+        self.stats = slices.parts[0]
+        self.busy_totals = [part.busy_time for part in slices.parts]
+        self.peak_event_queue = 0  # наибольший размер кучи событий SimPy в моменты прибытий
+        self.in_system = TimeWeighted()  # число пассажиров в аэропорту
+        self.presence_before = 0.0  # его интеграл до начала текущего отрезка
+        self.draw_passenger = make_passenger_sampler(model.route, streams)
+
+        self.resources = {}
+        self.stages = []
+        for spec in model.route:
+            if spec.resource not in self.resources:
+                self.resources[spec.resource] = MonitoredResource(
+                    env, model.resource_counts[spec.resource], spec.resource, slices)
+        for i, spec in enumerate(model.route):
+            self.stages.append(Stage(spec.name, i, self.resources[spec.resource]))
+        # Таблица для цикла прохождения: (запрос ресурса, ресурс)
+        self.table = [(stage.resource.request, stage.resource) for stage in self.stages]
+
+    def passenger_journey(self, passenger_id):
+        """Процесс прохождения пассажира через аэропорт с уходом по таймауту"""
+        env = self.env
         arrival_time = env.now
+        deadline = arrival_time + self.model.max_wait_time
         timed_out = False  # Флаг для отслеживания таймаута
+        passenger = self.draw_passenger()
+        ticket = self.watcher.watch(deadline)
+        table = self.table
+        in_system = self.in_system
+        in_system.update(arrival_time, in_system.level + 1)
 
         try:
-            # Регистрация на рейс и сдача багажа (обязательно)
-            with airport.registration.request() as request:
-                remaining_time = MAX_WAIT_TIME - (env.now - arrival_time)
-                if remaining_time <= 0:
-                    timed_out = True
-                    return
-                result = yield request | env.timeout(remaining_time)
-                if request not in result:
-                    timed_out = True
-                    return
-                start_time = env.now
-                yield env.process(airport.register_passenger(passenger_id))
-                duration = env.now - start_time
-                service_durations['registration'].append(duration)
-
-            # Посещение туалета
-            if random.random() < prob_toilet_before:
-                with airport.toilet_before.request() as request:
-                    remaining_time = MAX_WAIT_TIME - (env.now - arrival_time)
-                    if remaining_time <= 0:
+            for i in range(len(table)):
+                service_time = passenger[i]
+                if service_time is None:
+                    continue
+                request_slot, resource = table[i]
+                with request_slot() as request:
+                    if env.now >= deadline:
+                        self.stats.stages[i].reneged += 1
                         timed_out = True
                         return
-                    result = yield request | env.timeout(remaining_time)
-                    if request not in result:
+                    queued = resource.enqueue(request)
+                    ticket[2] = request
+                    try:
+                        yield request
+                    except simpy.Interrupt:
+                        resource.dequeue(request, env.now)
+                        self.stats.stages[i].reneged += 1
                         timed_out = True
                         return
-                    start_time = env.now
-                    yield env.process(airport.use_toilet(passenger_id))
-                    duration = env.now - start_time
-                    service_durations['toilet'].append(duration)
-
-            # Проверка безопасности (обязательно)
-            with airport.security.request() as request:
-                remaining_time = MAX_WAIT_TIME - (env.now - arrival_time)
-                if remaining_time <= 0:
-                    timed_out = True
-                    return
-                result = yield request | env.timeout(remaining_time)
-                if request not in result:
-                    timed_out = True
-                    return
-                start_time = env.now
-                yield env.process(airport.check_security(passenger_id))
-                duration = env.now - start_time
-                service_durations['security'].append(duration)
-
-            # Таможенная проверка для международных рейсов
-            if random.random() < prob_customs:
-                with airport.customs.request() as request:
-                    remaining_time = MAX_WAIT_TIME - (env.now - arrival_time)
-                    if remaining_time <= 0:
-                        timed_out = True
-                        return
-                    result = yield request | env.timeout(remaining_time)
-                    if request not in result:
-                        timed_out = True
-                        return
-                    start_time = env.now
-                    yield env.process(airport.check_customs(passenger_id))
-                    duration = env.now - start_time
-                    service_durations['customs'].append(duration)
-
-            # Покупки в Duty Free
-            if random.random() < prob_duty_free:
-                with airport.duty_free.request() as request:
-                    remaining_time = MAX_WAIT_TIME - (env.now - arrival_time)
-                    if remaining_time <= 0:
-                        timed_out = True
-                        return
-                    result = yield request | env.timeout(remaining_time)
-                    if request not in result:
-                        timed_out = True
-                        return
-                    start_time = env.now
-                    yield env.process(airport.visit_duty_free(passenger_id))
-                    duration = env.now - start_time
-                    service_durations['duty_free'].append(duration)
-
-            # Посещение ресторана
-            if random.random() < prob_restaurant:
-                with airport.restaurant.request() as request:
-                    remaining_time = MAX_WAIT_TIME - (env.now - arrival_time)
-                    if remaining_time <= 0:
-                        timed_out = True
-                        return
-                    result = yield request | env.timeout(remaining_time)
-                    if request not in result:
-                        timed_out = True
-                        return
-                    start_time = env.now
-                    yield env.process(airport.use_restaurant(passenger_id))
-                    duration = env.now - start_time
-                    service_durations['restaurant'].append(duration)
-
-            # Еще раз туалет перед посадкой
-            if random.random() < prob_toilet_after:
-                with airport.toilet_after.request() as request:
-                    remaining_time = MAX_WAIT_TIME - (env.now - arrival_time)
-                    if remaining_time <= 0:
-                        timed_out = True
-                        return
-                    result = yield request | env.timeout(remaining_time)
-                    if request not in result:
-                        timed_out = True
-                        return
-                    start_time = env.now
-                    yield env.process(airport.use_toilet(passenger_id))
-                    duration = env.now - start_time
-                    service_durations['toilet'].append(duration)
-
-            # Посадка на рейс (обязательно)
-            with airport.boarding_gate.request() as request:
-                remaining_time = MAX_WAIT_TIME - (env.now - arrival_time)
-                if remaining_time <= 0:
-                    timed_out = True
-                    return
-                result = yield request | env.timeout(remaining_time)
-                if request not in result:
-                    timed_out = True
-                    return
-                start_time = env.now
-                yield env.process(airport.board_flight(passenger_id))
-                duration = env.now - start_time
-                service_durations['boarding'].append(duration)
-
-            # Сохраняем общее время пребывания пассажира в аэропорту
-            total_time = env.now - arrival_time
-            wait_times.append(total_time)
-            served_passengers += 1
+                    ticket[2] = None
+                    yield from self.serve(i, service_time, request, queued)
+            self.complete(arrival_time)
 
         finally:
+            ticket[1] = None
             # Обработка таймаута
             if timed_out:
-                timeout_passengers += 1
-                rejected_passengers += 1
-
-    def run_airport(env, airport, passenger_arrival_rate):
+                self.stats.timeout_passengers += 1
+                self.stats.rejected_passengers += 1
+                in_system.update(env.now, in_system.level - 1)
+
+    def passenger_journey_no_reneging(self, passenger_id):
+        """
+        Прохождение пассажира, когда уход по таймауту невозможен: обычные
+        запрос ресурса и обслуживание без дедлайна и наблюдателя.
+        """
+        arrival_time = self.env.now
+        passenger = self.draw_passenger()
+        table = self.table
+        in_system = self.in_system
+        in_system.update(arrival_time, in_system.level + 1)
+
+        for i in range(len(table)):
+            service_time = passenger[i]
+            if service_time is None:
+                continue
+            request_slot, resource = table[i]
+            with request_slot() as request:
+                queued = resource.enqueue(request)
+                yield request
+                yield from self.serve(i, service_time, request, queued)
+        self.complete(arrival_time)
+
+    def serve(self, i, service_time: float, request, queued: bool):
+        """
+        Обслуживание пассажира на этапе i после удовлетворения запроса request
+        (queued - запрос стоял в очереди): учет ожидания, занятости канала
+        и длительности обслуживания, общий для обоих вариантов прохождения.
+        """
+        env = self.env
+        resource = self.table[i][1]
+        start_time = env.now
+        if queued:
+            resource.dequeue(request, start_time)
+        stage = self.stats.stages[i]
+        stage.started += 1
+        if queued:
+            stage.queue_wait.add(start_time - request.queued_at)
+        self.slices.spread(self.busy_totals, resource.name, start_time, start_time + service_time)
+        yield env.timeout(service_time)
+        self.stats.stages[i].service.add(env.now - start_time)
+
+    def complete(self, arrival_time: float) -> None:
+        """Пассажир, появившийся в момент arrival_time, прошел маршрут."""
+        now = self.env.now
+        # Сохраняем общее время пребывания пассажира в аэропорту
+        total_time = now - arrival_time
+        self.stats.wait_stats.add(total_time)
+        self.stats.wait_sketch.add(total_time)
+        self.stats.served_passengers += 1
+        if self.completions is not None:
+            self.completions.add(now, total_time)
+        self.in_system.update(now, self.in_system.level - 1)
+
+    def close_part(self, until: float) -> None:
+        """Завершает текущий отрезок в момент until: интеграл числа пассажиров и наибольшие очереди."""
+        stats = self.stats
+        presence = self.in_system.integral(until)
+        stats.presence_time = presence - self.presence_before
+        self.presence_before = presence
+        for name, resource in self.resources.items():
+            stats.max_queue[name] = resource.snapshot()
+
+    def slice_clock(self):
+        """Процесс границ отрезков: в каждой границе накопители переключаются на следующий отрезок."""
+        for bound in self.slices.bounds[:-1]:
+            yield self.env.timeout(bound - self.env.now)
+            self.close_part(bound)
+            self.part += 1
+            self.stats = self.slices.parts[self.part]
+
+    def run_airport(self):
         """Генерация потока пассажиров"""
-        nonlocal total_generated_passengers
+        env = self.env
+        journey = self.passenger_journey if self.model.reneging else self.passenger_journey_no_reneging
+        interarrival = functools.partial(self.streams.arrival.expovariate, 1.0 / self.model.passenger_arrival_rate)
         passenger_id = 0
+        if len(self.slices.parts) > 1:
+            env.process(self.slice_clock())
 
         # Первоначально несколько пассажиров уже в аэропорту
-        for i in range(INITIAL_PASSENGERS):
-            total_generated_passengers += 1
-            env.process(passenger_journey(env, passenger_id, airport))
+        for i in range(self.model.initial_passengers):
+            self.stats.total_generated_passengers += 1
+            env.process(journey(passenger_id))
             passenger_id += 1
 
         # Генерация новых пассажиров
         while True:
-            yield env.timeout(random.expovariate(
-                1.0 / passenger_arrival_rate))  # каждые passenger_arrival_rate минут приходит пассажир
-            total_generated_passengers += 1
-            env.process(passenger_journey(env, passenger_id, airport))
+            yield env.timeout(interarrival())  # в среднем каждые passenger_arrival_rate минут приходит пассажир
+            self.stats.total_generated_passengers += 1
+            env.process(journey(passenger_id))
             passenger_id += 1
+            # Размер кучи событий замеряется только при прибытиях: одно len() на
+            # пассажира вместо перехвата каждого события, поэтому это не точный пик
+            queue_size = simpy_event_queue_size(env)
+            if queue_size > self.peak_event_queue:
+                self.peak_event_queue = queue_size
 
-    def calculate_statistics(wait_times, service_durations, simulation_time, resource_counts):
-        """Расчет статистики системы с корректной утилизацией"""
-        if not wait_times:
-            return None
+    def finish(self) -> Dict[str, Any]:
+        """Завершает статистику последнего отрезка и возвращает диагностику движка SimPy."""
+        horizon = self.model.simulation_time
+        for resource in self.resources.values():
+            resource.finish(horizon)
+        self.close_part(horizon)
+        return {'event_count': simpy_event_count(self.env),
+                'peak_event_queue_at_arrivals': self.peak_event_queue}
 
-        avg_wait_time = statistics.mean(wait_times)
-        avg_passengers_in_system = len(wait_times) * avg_wait_time / simulation_time
 
-        # Коэффициент использования для каждого типа ресурса
-        utilization = {}
-        for service, durations in service_durations.items():
-            if service in resource_counts:
-                total_service_time = sum(durations)
-                total_possible_time = simulation_time * resource_counts[service]
-                utilization[service] = total_service_time / total_possible_time if total_possible_time > 0 else 0.0
-            else:
-                utilization[service] = 0.0
-
-        # Абсолютная пропускная способность (пассажиров в час)
-        absolute_throughput = (served_passengers / simulation_time) * 60
-
-        # Относительная пропускная способность
-        total_passengers = served_passengers + rejected_passengers
-        relative_throughput = served_passengers / total_passengers if total_passengers > 0 else 0
-
-        # Отношение обработанных пассажиров
-        served_ratio = served_passengers / total_generated_passengers if total_generated_passengers > 0 else 0
-
-        return {
-            'avg_wait_time': avg_wait_time,
-            'avg_passengers_in_system': avg_passengers_in_system,
-            'utilization': utilization,
-            'absolute_throughput': absolute_throughput,
-            'relative_throughput': relative_throughput,
-            'generated_passengers': total_generated_passengers,
-            'served_ratio': served_ratio,
-            'served_passengers': served_passengers,
-            'rejected_passengers': rejected_passengers,
-            'timeout_passengers': timeout_passengers
-        }
-
-    env = simpy.Environment()
-    airport = Airport(env, num_registration_agents, num_security_agents, num_customs_agents,
-                      num_duty_free_cashiers, num_restaurant_tables, num_toilets_before,
-                      num_toilets_after, num_boarding_gates)
-    env.process(run_airport(env, airport, passenger_arrival_rate))
-    env.run(until=SIMULATION_TIME)
-
-    stats = calculate_statistics(wait_times, service_durations, SIMULATION_TIME, airport.resource_counts)
+# Сколько отрезков времени записывает запуск с разогревом 'mser': найденный
+# момент конца разогрева округляется вверх до их границы
+WARMUP_SLICES = 100
+
+
+def batch_means_report(slices: RunSlices, first: int, k: int, confidence: float = 0.95) -> Dict[str, Any]:
+    """
+    Анализ одного длинного запуска методом групповых средних: отрезки slices
+    после разогрева (с first) объединяются в k групп соседних отрезков почти
+    равной длины, и по статистике групп для каждой числовой метрики (вложенные
+    - под ключами через точку, например 'utilization.security') считаются
+    среднее, полуширина интервала и автокорреляция соседних групп
+    (batch_means_interval); счетчики (served_passengers и т.п.) - в расчете на
+    группу. Группы без обслуженных пассажиров не учитываются.
+    """
+    groups = np.array_split(np.arange(first, len(slices.parts)), min(k, len(slices.parts) - first))
+    batches = [slices.statistics(int(group[0]), int(group[-1]) + 1) for group in groups]
+    present = [stats for stats in batches if stats is not None]
+    metrics = {}
+    for path in _numeric_paths(present[0] if present else {}):
+        values = [_lookup(stats, path) if stats is not None else np.nan for stats in batches]
+        metrics['.'.join(path)] = batch_means_interval(values, confidence)
+    return {
+        'batches': len(groups),
+        'confidence': confidence,
+        'metrics': metrics,
+    }
+
+
+def mser_warmup(series: BatchSeries, slices: RunSlices) -> int:
+    """
+    Число отбрасываемых первых отрезков slices по правилу MSER-5:
+    mser_truncation выбирает, сколько первых групп по 5 обслуженных
+    пассажиров (series) отбросить, и разогрев продолжается до первой границы
+    отрезков не раньше завершения первого оставленного пассажира.
+    """
+    batches = mser_truncation(series.means, 1)
+    if not batches:
+        return 0
+    return min(bisect.bisect_left(slices.starts, series.starts[batches]), len(slices.parts) - 1)
+
+
+class AirportModel(object):
+    """
+    Модель аэропорта, построенная один раз по словарю параметров: маршрут,
+    число ресурсов и режим ухода по таймауту разбираются в конструкторе,
+    а run(seed) многократно запускает симуляцию с разными зернами.
+    Объект пригоден для передачи в процессы пула (pickle).
+    """
+
+    def __init__(self, params: Dict[str, Any]):
+        self.params = params
+        self.max_wait_time = params.get('max_time', 180)
+        self.simulation_time = params.get('simulation_time', 480)  # Default 8 hours
+        self.initial_passengers = params.get('initial_passengers', 100)
+        self.passenger_arrival_rate = params['passenger_arrival_rate']
+        self.route = build_route(params)
+        self.resource_counts = route_resource_counts(params, self.route)
+        self.reneging = reneging_enabled(params)
+        # Анализ методом групповых средних: число групп (None - не проводится)
+        self.batch_means = params.get('batch_means')
+        if self.batch_means is not None and self.batch_means < 2:
+            raise ValueError("batch_means - число групп, не меньше 2")
+        # Разогрев: None - без усечения, число - фиксированная длительность
+        # в минутах, 'mser' - выбор по правилу MSER-5 после того же запуска
+        # (по умолчанию при анализе групповых средних, где явный null означает
+        # разогрев 0)
+        self.warmup = params.get('warmup', 'mser' if self.batch_means else None)
+        if self.warmup is None and self.batch_means:
+            self.warmup = 0.0
+        if self.warmup is not None and self.warmup != 'mser':
+            self.warmup = float(self.warmup)
+            if not 0 <= self.warmup < self.simulation_time:
+                raise ValueError("warmup должен быть 'mser' или числом от 0 до simulation_time")
+
+    def run(self, seed: int = None, engine: str = None) -> Dict[str, Any]:
+        """
+        Один запуск модели с зерном seed (или params['seed']) на движке engine
+        (или params['engine']): 'simpy' (по умолчанию), 'fast' или 'vector'.
+        """
+        if seed is None:
+            seed = self.params.get('seed')
+        if engine is None:
+            engine = self.params.get('engine', 'simpy')
+
+        # Запуск записывает статистику по отрезкам времени (RunSlices): при
+        # 'mser' - по WARMUP_SLICES мелким отрезкам, чтобы отбросить разогрев
+        # уже после запуска, иначе - отрезок разогрева и группы batch_means
+        series = None
+        if self.warmup == 'mser':
+            count = WARMUP_SLICES
+            if self.batch_means:
+                count = self.batch_means * -(-WARMUP_SLICES // self.batch_means)
+            slices = RunSlices.uniform(self.route, self.resource_counts, self.simulation_time, count)
+            series = BatchSeries(5)
+        else:
+            slices = RunSlices.uniform(self.route, self.resource_counts, self.simulation_time,
+                                       self.batch_means or 1, self.warmup or 0.0)
+        diagnostics = self._simulate(seed, engine, slices, series)
+
+        first, warmup = 0, None
+        if self.warmup == 'mser':
+            first = mser_warmup(series, slices)
+            warmup = {'method': 'mser5', 'time': slices.starts[first],
+                      'truncated_completions': sum(part.served_passengers for part in slices.parts[:first])}
+        elif self.warmup is not None:
+            first = 1 if self.warmup > 0 else 0
+            warmup = {'method': 'fixed', 'time': self.warmup}
+        stats = slices.statistics(first)
+        if stats is not None:
+            stats.update(diagnostics)
+            if warmup is not None:
+                stats['warmup'] = warmup
+            if self.batch_means:
+                stats['batch_means'] = batch_means_report(slices, first, self.batch_means)
+        return stats
+
+    def _simulate(self, seed: int, engine: str, slices: RunSlices, completions=None) -> Dict[str, Any]:
+        """Запуск выбранного движка с записью статистики в slices; возвращает диагностику движка."""
+        if engine == 'fast':
+            return run_fast(self, slices, seed, completions)
+        if engine == 'vector':
+            return run_vector(self, slices, seed, completions)
+        if engine != 'simpy':
+            raise ValueError(f"Неизвестный движок симуляции: {engine}")
+
+        env = simpy.Environment()
+        airport = Airport(env, self, RandomStreams(seed), slices, completions)
+        env.process(airport.run_airport())
+        env.run(until=self.simulation_time)
+        return airport.finish()
+
+
+# Модели, уже построенные в этом процессе (например, в процессе пула grid search)
+_MODEL_CACHE = collections.OrderedDict()
+_MODEL_CACHE_SIZE = 16
+
+
+def get_model(params: Dict[str, Any]) -> AirportModel:
+    """
+    Возвращает AirportModel для params, строя его только при первом обращении
+    в текущем процессе, так что повторы одной конфигурации не платят за разбор параметров.
+    """
+    key = json.dumps(params, sort_keys=True)
+    model = _MODEL_CACHE.get(key)
+    if model is None:
+        model = _MODEL_CACHE[key] = AirportModel(params)
+        if len(_MODEL_CACHE) > _MODEL_CACHE_SIZE:
+            _MODEL_CACHE.popitem(last=False)
+    else:
+        _MODEL_CACHE.move_to_end(key)
+    return model
+
+
+# Версия модели в ключах кэша результатов: увеличивается при любом изменении,
+# после которого те же параметры и зерно дают другую статистику
+SIMULATOR_VERSION = 4
+RESULT_CACHE_DIR = ".result_cache"
+RESULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# После записи такой доли max_bytes объем кэша измеряется заново, чтобы
+# учесть записи других процессов (например, пула grid search)
+RESULT_CACHE_RESCAN_FRACTION = 0.01
+
+
+def _canonical_json(value: Any) -> str:
+    """Канонический JSON (сортированные ключи, без пробелов) для хеширования."""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+class ResultCache(object):
+    """
+    Дисковый кэш статистики запусков, адресуемый содержимым: ключ - sha256
+    канонического JSON параметров, зерна, движка и SIMULATOR_VERSION, запись -
+    файл <каталог>/<первые 2 символа ключа>/<ключ>.json. Время изменения файла
+    служит отметкой последнего использования: когда объем превышает max_bytes,
+    удаляются давно не использованные записи (LRU). Записи пишутся атомарно,
+    поэтому кэш могут одновременно использовать несколько процессов; записи,
+    удаленные другим процессом, просто пропускаются. Кэш необязателен: ошибки
+    файловой системы при записи и вытеснении не прерывают запуск.
+    """
+
+    def __init__(self, path: str = RESULT_CACHE_DIR, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._size = None  # объем при последнем измерении, измеряется при первой записи
+        self._written = 0  # записано этим процессом после последнего измерения
+
+    @staticmethod
+    def key(params: Dict[str, Any], seed: int, engine: str = None) -> str:
+        engine = engine or params.get('engine', 'simpy')
+        canonical = _canonical_json({'params': params, 'seed': seed, 'engine': engine,
+                                     'version': SIMULATOR_VERSION})
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key + '.json')
+
+    def get(self, key: str) -> tuple:
+        """(True, статистика) при попадании, иначе (False, None)."""
+        path = self._file(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return False, None
+        try:
+            os.utime(path)
+        except OSError:
+            pass  # запись успели вытеснить, но прочитана она целиком
+        return True, entry['statistics']
+
+    def put(self, key: str, stats: Dict[str, Any]) -> None:
+        path = self._file(key)
+        data = json.dumps({'statistics': stats}, ensure_ascii=False).encode('utf-8')
+        temporary = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temporary, 'wb') as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except OSError:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            return
+        self._written += len(data)
+        if (self._size is None or self._size + self._written > self.max_bytes
+                or self._written > RESULT_CACHE_RESCAN_FRACTION * self.max_bytes):
+            # Решение о вытеснении - только по реальному объему, вместе с записями других процессов
+            self._size = sum(size for _, _, size in self._entries())
+            self._written = 0
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def _entries(self) -> Iterator[tuple]:
+        """Записи кэша: (время последнего использования, путь, размер)."""
+        try:
+            buckets = [bucket.path for bucket in os.scandir(self.path) if bucket.is_dir()]
+        except OSError:
+            return
+        for bucket in buckets:
+            try:
+                entries = list(os.scandir(bucket))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.endswith('.json'):
+                    try:
+                        info = entry.stat()
+                    except OSError:
+                        continue  # удалена другим процессом
+                    yield info.st_mtime, entry.path, info.st_size
+
+    def evict(self) -> None:
+        """Удаляет давно не использованные записи, пока объем не станет не больше 90% max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
+        self._written = 0
+
+
+_RESULT_CACHE = None
+
+
+def get_result_cache() -> ResultCache:
+    """Кэш результатов текущего процесса."""
+    global _RESULT_CACHE
+    if _RESULT_CACHE is None:
+        _RESULT_CACHE = ResultCache()
+    return _RESULT_CACHE
+
+
+def run_simulation_with_params(params: Dict[str, Any], seed: int = None, engine: str = None,
+                               cache: bool = True):
+    """
+    Запуск симуляции с заданными параметрами.
+    Все случайные величины запуска берутся из собственных потоков RandomStreams,
+    инициализированных seed (или params['seed']); engine выбирает движок.
+    Если зерно известно и cache=True, статистика сначала ищется в ResultCache,
+    а после симуляции записывается в него.
+    """
+    if seed is None:
+        seed = params.get('seed')
+    if not cache or seed is None:
+        return get_model(params).run(seed, engine), params
+
+    result_cache = get_result_cache()
+    key = result_cache.key(params, seed, engine)
+    hit, stats = result_cache.get(key)
+    if not hit:
+        stats = get_model(params).run(seed, engine)
+        result_cache.put(key, stats)
     return stats, params
 
 
+def _numeric_paths(stats: Dict[str, Any], prefix: tuple = ()) -> Iterator[tuple]:
+    """
+    Пути (кортежи ключей) ко всем числовым значениям вложенного словаря
+    статистики, кроме гистограмм (ключи *_sketch).
+    """
+    for key, value in stats.items():
+        if key.endswith('_sketch'):
+            continue
+        if isinstance(value, dict):
+            yield from _numeric_paths(value, prefix + (key,))
+        elif isinstance(value, (int, float)):
+            yield prefix + (key,)
+
+
+def _lookup(stats: Dict[str, Any], path: tuple) -> Any:
+    for key in path:
+        stats = stats[key]
+    return stats
+
+
+class RunColumns(object):
+    """
+    Колоночные результаты серии запусков одной конфигурации: для каждой
+    числовой метрики - массив NumPy по запускам (вложенные значения под
+    ключами через точку, например 'resources.security.avg_queue_length'),
+    для коэффициентов использования - двумерный массив (запуски x ресурсы)
+    со столбцами в порядке resources, для гистограмм (*_sketch) - списки
+    QuantileSketch. Запуски без статистики (None) отмечены False в valid,
+    их значения - NaN.
+    """
+
+    def __init__(self, seeds: List[int], stats_list: List[Dict[str, Any]]):
+        self.seeds = list(seeds)
+        self.valid = np.array([stats is not None for stats in stats_list], dtype=bool)
+        present = [stats for stats in stats_list if stats is not None]
+        first = present[0] if present else {}
+        self._layout = first
+
+        self.metrics = {}
+        for path in _numeric_paths(first):
+            if path[0] != 'utilization':
+                self.metrics['.'.join(path)] = np.array([_lookup(stats, path) if stats is not None else np.nan
+                                                         for stats in stats_list], dtype=float)
+        self.sketches = {key: [QuantileSketch.from_dict(stats[key]) for stats in present]
+                         for key in first if key.endswith('_sketch')}
+        self.resources = list(first.get('utilization', {}))
+        self.utilization = np.full((len(stats_list), len(self.resources)), np.nan)
+        for row, stats in enumerate(stats_list):
+            if stats is not None:
+                self.utilization[row] = [stats['utilization'][name] for name in self.resources]
+
+    def __len__(self):
+        return len(self.valid)
+
+    def half_width(self, key: str, confidence: float = 0.95) -> tuple:
+        """Среднее метрики key по запускам со статистикой и полуширина его доверительного интервала."""
+        series = RunningStats()
+        series.extend(self.metrics[key][self.valid])
+        return series.mean, series.half_width(confidence)
+
+    def pooled(self, key: str = 'wait_time_sketch') -> QuantileSketch:
+        """Объединение гистограмм key всех запусков: распределение по всем пассажирам серии."""
+        merged = QuantileSketch(self.sketches[key][0].relative_accuracy)
+        for sketch in self.sketches[key]:
+            merged.merge(sketch)
+        return merged
+
+    def mean(self) -> Dict[str, Any]:
+        """
+        Средние по запускам со статистикой в виде словаря той же структуры,
+        что и статистика одного запуска (None, если таких запусков нет).
+        Гистограммы объединяются, а процентили времени пребывания берутся
+        из объединенной гистограммы, а не усредняются; нечисловые значения
+        переносятся из первого запуска.
+        """
+        if not self.valid.any():
+            return None
+        valid = self.valid
+        utilization = dict(zip(self.resources, self.utilization[valid].mean(axis=0).tolist()))
+        pooled = {key: self.pooled(key) for key in self.sketches}
+
+        def rebuild(layout, prefix):
+            averaged = {}
+            for key, value in layout.items():
+                name = prefix + key
+                if name == 'utilization':
+                    averaged[key] = utilization
+                elif name in pooled:
+                    averaged[key] = pooled[name].to_dict()
+                elif isinstance(value, dict):
+                    averaged[key] = rebuild(value, name + '.')
+                elif name in self.metrics:
+                    averaged[key] = float(self.metrics[name][valid].mean())
+                else:
+                    # Нечисловые значения (например, warmup.method) берутся из первого запуска
+                    averaged[key] = value
+            return averaged
+
+        averaged = rebuild(self._layout, '')
+        if 'wait_time_sketch' in pooled:
+            for q in WAIT_PERCENTILES:
+                averaged[f'wait_time_p{q}'] = pooled['wait_time_sketch'].quantile(q / 100)
+        return averaged
+
+
+def run_many(params, seeds: List[int], engine: str = None):
+    """
+    Пакетный запуск: одна конфигурация params и список зерен seeds, результат -
+    RunColumns. Если params - список конфигураций, возвращается список
+    RunColumns; seeds тогда либо список списков (свой для каждой конфигурации),
+    либо один список для всех (общие случайные числа).
+    Модель строится один раз на конфигурацию.
+    """
+    if isinstance(params, dict):
+        model = get_model(params)
+        return RunColumns(seeds, [model.run(seed, engine) for seed in seeds])
+    if seeds and not isinstance(seeds[0], (list, tuple)):
+        seeds = [seeds] * len(params)
+    return [run_many(config, config_seeds, engine) for config, config_seeds in zip(params, seeds)]
+
+
 def _flatten_grid_config(d: Dict, parent_key: str = '') -> Dict[str, List | int]:
     """Flatten a nested grid config into dot-notation keys."""
     items = []
@@ -372,34 +815,157 @@ def _flatten_grid_config(d: Dict, parent_key: str = '') -> Dict[str, List | int]
                 items.append((new_key, v))
     return dict(items)
 
-def _set_nested_value(d: Dict, key_path: str, value: Any) -> None:
+def _with_values(base: Dict[str, Any], assignments) -> Dict[str, Any]:
     """
-    Set a value in a nested dict using a dot-separated key path.
+    Копия base с заданными значениями по путям через точку. Копируются только
+    словари на путях к изменяемым ключам, остальные поддеревья общие с base.
     """
-    keys = key_path.split(".")
-    for key in keys[:-1]:
-        d = d.setdefault(key, {})
-    d[keys[-1]] = value
+    params = dict(base)
+    copied = {(): params}
+    for key_path, value in assignments:
+        keys = tuple(key_path.split("."))
+        d = params
+        for depth in range(1, len(keys)):
+            prefix = keys[:depth]
+            if prefix not in copied:
+                child = d.get(keys[depth - 1])
+                d[keys[depth - 1]] = copied[prefix] = dict(child) if isinstance(child, dict) else {}
+            d = copied[prefix]
+        d[keys[-1]] = value
+    return params
+
+
+class GridConstraint(object):
+    """
+    Ограничение на конфигурации grid search (ключ 'constraints' в grid_config.json):
+      линейное  {"sum": [путь, ...] или {путь: вес, ...}, "min": a, "max": b}
+                (любая из границ может отсутствовать);
+      сравнение {"left": путь, "op": "<=", "right": путь или число},
+                op - один из <, <=, >, >=, ==, !=.
+    Пути - ключи параметров через точку, как в grid ("resources.security");
+    значения берутся из grid, а для ключей вне grid - из base config.
+    """
+
+    OPS = {'<': operator.lt, '<=': operator.le, '>': operator.gt,
+           '>=': operator.ge, '==': operator.eq, '!=': operator.ne}
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.spec = spec
+        self.weights = None
+        if 'sum' in spec:
+            terms = spec['sum']
+            self.weights = dict(terms) if isinstance(terms, dict) else {path: 1 for path in terms}
+            self.low, self.high = spec.get('min'), spec.get('max')
+            if self.low is None and self.high is None:
+                raise ValueError(f"Линейное ограничение grid должно задавать 'min' или 'max': {spec}")
+            self.paths = set(self.weights)
+        elif 'left' in spec and 'right' in spec:
+            if spec.get('op') not in self.OPS:
+                raise ValueError(f"Неизвестная операция ограничения grid: {spec.get('op')}")
+            self.compare = self.OPS[spec['op']]
+            self.left, self.right = spec['left'], spec['right']
+            self.paths = {self.left} | ({self.right} if isinstance(self.right, str) else set())
+        else:
+            raise ValueError(f"Неизвестное ограничение grid: {spec}")
+
+    def holds(self, values: Dict[str, Any]) -> bool:
+        """Выполняется ли ограничение при значениях путей values."""
+        if self.weights is not None:
+            total = sum(weight * values[path] for path, weight in self.weights.items())
+            return ((self.low is None or total >= self.low) and
+                    (self.high is None or total <= self.high))
+        right = values[self.right] if isinstance(self.right, str) else self.right
+        return self.compare(values[self.left], right)
 
+    def __repr__(self):
+        return f"GridConstraint({self.spec})"
 
-def generate_grid_search_params(base_params: Dict[str, Any], grid_params: Dict[str, List]) -> List[Dict[str, Any]]:
+
+def parse_grid_constraints(grid_config: Dict[str, Any]) -> tuple:
     """
-    Генерирует список параметров для grid search на базе base_config.
+    Отделяет ограничения от диапазонов grid_config: возвращает
+    (плоские диапазоны для _flatten_grid_config, список GridConstraint).
     """
-    if not grid_params:
-        return [json.loads(json.dumps(base_params))]  # deep copy
+    grid_config = dict(grid_config)
+    constraints = [GridConstraint(spec) for spec in grid_config.pop('constraints', [])]
+    return _flatten_grid_config(grid_config), constraints
+
 
-    keys, values = zip(*grid_params.items())
-    combinations = [dict(zip(keys, v)) for v in itertools.product(*values)]
+def _feasible_assignments(base_params: Dict[str, Any], grid_params: Dict[str, List],
+                          constraints: List[GridConstraint]) -> Iterator[tuple]:
+    """
+    Лениво порождает кортежи значений ключей grid в порядке itertools.product,
+    удовлетворяющие всем ограничениям. Ограничение проверяется, как только
+    заданы все его ключи grid, поэтому недопустимые поддеревья перебора
+    отсекаются целиком, а не отбрасываются по одной конфигурации.
+    """
+    keys = list(grid_params)
+    position = {key: depth for depth, key in enumerate(keys)}
+    values = {}
+    checks = [[] for _ in keys]
+    for constraint in constraints:
+        for path in constraint.paths - position.keys():
+            try:
+                values[path] = _lookup(base_params, tuple(path.split('.')))
+            except (KeyError, TypeError):
+                raise ValueError(f"Ограничение {constraint.spec} ссылается на отсутствующий параметр {path}")
+        depth = max((position[path] for path in constraint.paths if path in position), default=None)
+        if depth is None:
+            if not constraint.holds(values):
+                return
+        else:
+            checks[depth].append(constraint)
+
+    chosen = [None] * len(keys)
+
+    def walk(depth):
+        if depth == len(keys):
+            yield tuple(chosen)
+            return
+        key, level_checks = keys[depth], checks[depth]
+        for value in grid_params[key]:
+            values[key] = chosen[depth] = value
+            if all(constraint.holds(values) for constraint in level_checks):
+                yield from walk(depth + 1)
+
+    yield from walk(0)
+
+
+def count_grid_combinations(grid_params: Dict[str, List], base_params: Dict[str, Any] = None,
+                            constraints: List[GridConstraint] = ()) -> int:
+    """
+    Число конфигураций grid search без их построения; с ограничениями -
+    число допустимых (перебор значений с отсечением, без словарей параметров).
+    """
+    if not constraints:
+        return math.prod(len(values) for values in grid_params.values())
+    return sum(1 for _ in _feasible_assignments(base_params, grid_params, constraints))
+
+
+def iter_grid_search_params(base_params: Dict[str, Any], grid_params: Dict[str, List],
+                            constraints: List[GridConstraint] = ()) -> Iterator[Dict[str, Any]]:
+    """
+    Лениво порождает параметры grid search на базе base_config в порядке
+    itertools.product, пропуская конфигурации, нарушающие constraints.
+    Конфигурации разделяют неизменяемые поддеревья с base_params,
+    поэтому их следует только читать.
+    """
+    keys = list(grid_params)
+    if constraints:
+        combos = _feasible_assignments(base_params, grid_params, constraints)
+    else:
+        combos = itertools.product(*grid_params.values())
+    for combo in combos:
+        yield _with_values(base_params, zip(keys, combo))
 
-    param_list = []
-    for combo in combinations:
-        params = json.loads(json.dumps(base_params))  # deep copy via JSON
-        for key_path, value in combo.items():
-            _set_nested_value(params, key_path, value)
-        param_list.append(params)
 
-    return param_list
+def generate_grid_search_params(base_params: Dict[str, Any], grid_params: Dict[str, List],
+                                constraints: List[GridConstraint] = ()) -> List[Dict[str, Any]]:
+    """
+    Генерирует список параметров для grid search на базе base_config
+    (см. iter_grid_search_params).
+    """
+    return list(iter_grid_search_params(base_params, grid_params, constraints))
 
 
 def _update_params_recursive(target: Dict, updates: Dict):
@@ -413,85 +979,594 @@ def _update_params_recursive(target: Dict, updates: Dict):
             target[key] = value
 
 
-def run_grid_search(base_config_path: str, grid_config_path: str, num_runs_per_config: int = 1):
+def _run_grid_task(task) -> Dict[str, Any]:
     """
-    Запуск grid search по параметру заданному в grid_config_path,
-    используя base_config_path как базу. Каждая конфигурация запускается num_runs_per_config раз.
+    Один запуск (конфигурация, повтор) grid search.
+    Функция уровня модуля, чтобы её можно было передать в пул процессов.
     """
-    base_params = load_params_from_json(base_config_path)
-    grid_params = load_params_from_json(grid_config_path)
+    config_index, run_id, params, seed, engine, cache = task
+    try:
+        stats, used_params = run_simulation_with_params(params, seed, engine, cache)
+        return {'run_id': run_id, 'seed': seed, 'statistics': stats}
+    except Exception as e:
+        return {'run_id': run_id, 'seed': seed, 'error': str(e)}
+
+
+def config_seed_key(params: Dict[str, Any]) -> int:
+    """Ключ содержимого конфигурации для derive_run_seed: первые 64 бита sha256 канонического JSON."""
+    digest = hashlib.sha256(_canonical_json(params).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def _grid_seed(root_seed: int, params: Dict[str, Any], run_id: int, crn: bool = False) -> int:
+    """
+    Зерно запуска grid search: derive_run_seed(root_seed, config_seed_key(params), run_id);
+    в режиме crn конфигурация не учитывается, и повтор k всех конфигураций
+    получает одно и то же зерно (common random numbers).
+    """
+    return derive_run_seed(root_seed, 0 if crn else config_seed_key(params), run_id)
+
+
+# Сколько задач на процесс пула может находиться в работе одновременно
+GRID_TASKS_PER_WORKER = 4
 
-    param_combinations = generate_grid_search_params(base_params, _flatten_grid_config(grid_params))
-    results = []
-    total_configs = len(param_combinations)
-    print(f"Запуск grid search с {total_configs} настройками...")
 
-    for i, params in enumerate(param_combinations):
-        print(f"\n--- Запуск конфигурации {i + 1}/{total_configs} ---")
-        print(f"Параметры: {params}")
-        config_results = {'parameters': params, 'runs': []}
+def _bounded_map(executor, function, items, workers: int) -> Iterator[Any]:
+    """
+    executor.map, который берет элементы из items по мере выдачи результатов:
+    в работе не более GRID_TASKS_PER_WORKER задач на каждый из workers
+    процессов, поэтому ленивый поток задач не разворачивается в память целиком.
+    """
+    window = GRID_TASKS_PER_WORKER * workers
+    pending = collections.deque()
+    for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _iter_grid_runs(tasks, workers: int = 1) -> Iterator[Dict[str, Any]]:
+    """
+    Выполняет задачи (индекс конфигурации, повтор, параметры, зерно, движок, кэш)
+    и отдает результаты в порядке задач, независимо от числа процессов.
+    Задачи могут быть ленивым итератором.
+    """
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from _bounded_map(executor, _run_grid_task, tasks, workers)
+    else:
+        yield from map(_run_grid_task, tasks)
+
+
+def params_fingerprint(params: Dict[str, Any], engine: str = None) -> str:
+    """Отпечаток конфигурации: sha256 канонического JSON параметров и движка."""
+    engine = engine or params.get('engine', 'simpy')
+    canonical = _canonical_json({'params': params, 'engine': engine})
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class GridCheckpoint(object):
+    """
+    Контрольная точка grid search: файл JSON Lines, в который каждый
+    завершенный запуск (конфигурация, повтор) дописывается сразу после
+    завершения. Первая строка - заголовок с корневым зерном. Запуск
+    определяется отпечатком конфигурации (params_fingerprint), номером повтора
+    и зерном, поэтому перезапуск с теми же файлами пропускает уже выполненное,
+    а строки конфигураций, которых больше нет в grid, просто не используются.
+    Запуски, записанные с ошибкой, при перезапуске выполняются снова: ошибка
+    могла быть вызвана самой аварией. Здесь же хранятся аналитические оценки
+    конфигураций (append_screen), чтобы каждая считалась один раз. В памяти
+    хранятся только смещения строк; оборванная при аварии последняя строка
+    отбрасывается.
+    """
 
-        for run_num in range(num_runs_per_config):
-            print(f"  Запуск {run_num + 1}/{num_runs_per_config}")
+    def __init__(self, path: str, fresh: bool = False):
+        self.path = path
+        self.root_seed = None
+        self.failed = 0  # запусков с ошибкой в загруженном файле
+        self._offsets = {}  # (отпечаток, повтор, зерно) -> смещение строки
+        self._screens = {}  # (отпечаток, sla) -> смещение строки оценки
+        if fresh and os.path.exists(path):
+            os.remove(path)
+        self._file = open(path, 'a+b')
+        self._load()
+
+    def _load(self) -> None:
+        f = self._file
+        f.seek(0)
+        offset = 0
+        for line in iter(f.readline, b''):
             try:
-                stats, used_params = run_simulation_with_params(params)
-                config_results['runs'].append({
-                    'run_id': run_num + 1,
-                    'statistics': stats
-                })
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b'\n'):
+                break
+            if 'screen' in record:
+                # Оценку, завершившуюся ошибкой, при перезапуске считаем снова, как и запуски
+                if record['screen']['verdict'] != 'error':
+                    self._screens[(record['fingerprint'], record['sla'])] = offset
+            elif 'error' in record:
+                self.failed += 1
+            elif 'fingerprint' in record:
+                self._offsets[(record['fingerprint'], record['run_id'], record['seed'])] = offset
+            elif 'root_seed' in record:
+                self.root_seed = record['root_seed']
+            offset += len(line)
+        f.truncate(offset)
+
+    def start(self, root_seed: int) -> None:
+        """Записывает заголовок в новый файл контрольной точки."""
+        if self.root_seed is None and not self._offsets:
+            self.root_seed = root_seed
+            self._write({'root_seed': root_seed})
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._offsets
+
+    def _write(self, record: Dict[str, Any]) -> int:
+        f = self._file
+        offset = f.seek(0, os.SEEK_END)
+        f.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+        f.flush()
+        return offset
+
+    def append(self, fingerprint: str, run: Dict[str, Any]) -> None:
+        """Дописывает результат запуска (словарь _run_grid_task) конфигурации fingerprint."""
+        self._offsets[(fingerprint, run['run_id'], run['seed'])] = self._write({'fingerprint': fingerprint, **run})
+
+    def read(self, key: tuple) -> Dict[str, Any]:
+        """Результат запуска key = (отпечаток, повтор, зерно) в виде словаря _run_grid_task."""
+        record = self._read(self._offsets[key])
+        del record['fingerprint']
+        return record
+
+    def _read(self, offset: int) -> Dict[str, Any]:
+        f = self._file
+        f.seek(offset)
+        return json.loads(f.readline())
+
+    def append_screen(self, fingerprint: str, sla: float, report: Dict[str, Any]) -> None:
+        """Дописывает аналитическую оценку конфигурации fingerprint при целевом sla."""
+        self._screens[(fingerprint, sla)] = self._write({'fingerprint': fingerprint, 'sla': sla, 'screen': report})
+
+    def read_screen(self, fingerprint: str, sla: float) -> Dict[str, Any]:
+        """Записанная оценка конфигурации или None."""
+        offset = self._screens.get((fingerprint, sla))
+        return None if offset is None else self._read(offset)['screen']
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _write_json_array(path: str, items: Iterator[Any]) -> None:
+    """
+    Записывает элементы в JSON-массив по одному, не собирая их в памяти;
+    результат совпадает с json.dump(list(items), f, indent=2, ensure_ascii=False).
+    Массив пишется во временный файл, который заменяет path только целиком,
+    поэтому ошибка или прерывание по ходу записи не портят прежний файл.
+    """
+    temporary = path + '.tmp'
+    try:
+        with open(temporary, 'w', encoding='utf-8') as f:
+            separator = '[\n'
+            for item in items:
+                f.write(separator)
+                f.write('\n'.join('  ' + line for line in json.dumps(item, indent=2, ensure_ascii=False).split('\n')))
+                separator = ',\n'
+            f.write('[]' if separator == '[\n' else '\n]')
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    os.replace(temporary, path)
+
+
+# Файл контрольной точки grid search (JSON Lines)
+GRID_CHECKPOINT_FILE = "grid_search_results.jsonl"
+
+# Метрики, по точности которых останавливается последовательный режим grid search,
+# и доверительная вероятность их интервалов
+SEQUENTIAL_METRICS = ('avg_wait_time', 'absolute_throughput')
+SEQUENTIAL_CONFIDENCE = 0.95
+# Сколько конфигураций последовательный режим доводит до нужной точности одновременно
+SEQUENTIAL_CHUNK = 256
+
+
+def _replication_summary(runs: List[Dict[str, Any]], precision: float) -> Dict[str, Any]:
+    """
+    Достигнутая точность серии запусков одной конфигурации: для каждой метрики
+    SEQUENTIAL_METRICS среднее, полуширина доверительного интервала и ее
+    отношение к среднему; converged - все отношения не больше precision.
+    """
+    columns = RunColumns([r['seed'] for r in runs], [r.get('statistics') for r in runs])
+    half_widths = {}
+    for key in SEQUENTIAL_METRICS:
+        mean, half_width = columns.half_width(key, SEQUENTIAL_CONFIDENCE) if key in columns.metrics else (0.0, math.inf)
+        if mean:
+            relative = half_width / abs(mean)
+        else:
+            relative = 0.0 if half_width == 0 else math.inf
+        half_widths[key] = {'mean': mean, 'half_width': half_width, 'relative': relative}
+    return {
+        'runs': len(runs),
+        'converged': all(metric['relative'] <= precision for metric in half_widths.values()),
+        'precision': precision,
+        'half_width': half_widths,
+    }
+
+
+def _next_series_size(summary: Dict[str, Any], max_runs: int):
+    """
+    Сколько запусков должно быть в серии после следующего раунда (None - серия
+    завершена: точность достигнута или запусков уже max_runs). Оценка по
+    текущей полуширине (она убывает как 1/sqrt(n)), но не больше удвоения серии.
+    """
+    n = summary['runs']
+    if summary['converged'] or n >= max_runs:
+        return None
+    worst = max(metric['relative'] for metric in summary['half_width'].values())
+    needed = math.ceil(n * (worst / summary['precision']) ** 2) if math.isfinite(worst) else 2 * n
+    return min(max_runs, max(n + 1, min(needed, 2 * n)))
+
+
+def _sequential_series(read, min_runs: int, max_runs: int, precision: float) -> tuple:
+    """
+    Серия запусков одной конфигурации, выбранная последовательным режимом:
+    правило остановки повторяется по запускам read(run_id) (из контрольной
+    точки). Возвращает (запуски, сводка _replication_summary).
+    """
+    runs = []
+    size = min_runs
+    while size is not None:
+        runs.extend(read(run_id) for run_id in range(len(runs) + 1, size + 1))
+        summary = _replication_summary(runs, precision)
+        size = _next_series_size(summary, max_runs)
+    return runs, summary
+
+
+def _run_sequential_grid(configs, min_runs: int, max_runs: int, precision: float, root_seed: int,
+                         checkpoint: GridCheckpoint, workers: int = 1, crn: bool = False,
+                         engine: str = None, cache: bool = True, exclude=None) -> None:
+    """
+    Последовательные повторы grid search: конфигурации из потока (индекс,
+    параметры) берутся частями по SEQUENTIAL_CHUNK и раундами получают новые
+    запуски, пока _next_series_size не сочтет серию законченной. Запуски
+    пишутся в checkpoint; конфигурации, для которых exclude(i, params, отпечаток)
+    истинно, не моделируются.
+    """
+    def keep(run):
+        stats = run.get('statistics')
+        return {'seed': run['seed'], 'statistics': {key: stats[key] for key in SEQUENTIAL_METRICS} if stats else None}
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    configs = iter(configs)
+    try:
+        while True:
+            chunk = list(itertools.islice(configs, SEQUENTIAL_CHUNK))
+            if not chunk:
+                break
+            # Состояние части: индекс -> (параметры, отпечаток, повтор -> значения метрик, целевой объем серии)
+            print(f"  Конфигурации {chunk[0][0] + 1}-{chunk[-1][0] + 1}")
+            active = {}
+            for i, params in chunk:
+                fingerprint = params_fingerprint(params, engine)
+                if exclude is None or not exclude(i, params, fingerprint):
+                    active[i] = (params, fingerprint, {}, min_runs)
+
+            round_num = 0
+            while active:
+                round_num += 1
+                print(f"  Раунд {round_num}: конфигураций {len(active)}")
+                pending = collections.deque()  # индексы конфигураций выданных задач по порядку
+
+                def tasks():
+                    """Задачи раунда; запуски из контрольной точки сразу учитываются в сериях."""
+                    for i, (params, fingerprint, runs, target) in active.items():
+                        for run_id in range(len(runs) + 1, target + 1):
+                            seed = _grid_seed(root_seed, params, run_id, crn)
+                            if (fingerprint, run_id, seed) in checkpoint:
+                                runs[run_id] = keep(checkpoint.read((fingerprint, run_id, seed)))
+                            else:
+                                pending.append(i)
+                                yield i, run_id, params, seed, engine, cache
+
+                results = _bounded_map(executor, _run_grid_task, tasks(), workers) if executor \
+                    else map(_run_grid_task, tasks())
+                for run in results:
+                    i = pending.popleft()
+                    params, fingerprint, runs, target = active[i]
+                    checkpoint.append(fingerprint, run)
+                    runs[run['run_id']] = keep(run)
+
+                unfinished = {}
+                for i, (params, fingerprint, runs, target) in active.items():
+                    summary = _replication_summary([runs[k] for k in sorted(runs)], precision)
+                    size = _next_series_size(summary, max_runs)
+                    if size is not None:
+                        unfinished[i] = (params, fingerprint, runs, size)
+                active = unfinished
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def run_grid_search(base_config_path: str, grid_config_path: str, num_runs_per_config: int = 1,
+                    workers: int = 1, root_seed: int = None, crn: bool = False, engine: str = None,
+                    precision: float = None, max_runs: int = 100, batch_means: int = None,
+                    fresh: bool = False, cache: bool = True, screen: str = None,
+                    sla: float = None) -> str:
+    """
+    Запуск grid search по параметру заданному в grid_config_path,
+    используя base_config_path как базу. Каждая конфигурация запускается
+    num_runs_per_config раз (или до точности precision), запуски сразу
+    дописываются в контрольную точку GRID_CHECKPOINT_FILE, из которой затем
+    по одной конфигурации собирается итоговый файл. Возвращает путь итогового
+    файла; смысл остальных параметров - в описании ключей командной строки.
+    """
+    base_params = load_params_from_json(base_config_path)
+    if batch_means is not None:
+        base_params['batch_means'] = batch_means
+    if base_params.get('batch_means') is not None:
+        # Полуширины и автокорреляции групповых средних нельзя усреднять по запускам
+        if precision is not None:
+            raise ValueError("Анализ групповых средних (batch_means) несовместим с precision: "
+                             "это один длинный запуск на конфигурацию")
+        if num_runs_per_config != 1:
+            print(f"Анализ групповых средних: один запуск на конфигурацию вместо {num_runs_per_config}")
+            num_runs_per_config = 1
+    if screen not in (None, 'flag', 'skip'):
+        raise ValueError(f"Неизвестный режим аналитической проверки: {screen}")
+    grid_params, constraints = parse_grid_constraints(load_params_from_json(grid_config_path))
+    total_configs = count_grid_combinations(grid_params, base_params, constraints)
+
+    checkpoint = GridCheckpoint(GRID_CHECKPOINT_FILE, fresh)
+    if root_seed is None:
+        root_seed = base_params.get('seed', checkpoint.root_seed)
+    random_root = root_seed is None
+    if random_root:
+        root_seed = new_root_seed()
+    checkpoint.start(root_seed)
+
+    def combinations():
+        return iter_grid_search_params(base_params, grid_params, constraints)
+
+    def screened(params, fingerprint):
+        """Аналитическая оценка конфигурации (None без проверки); считается один раз."""
+        if screen is None:
+            return None
+        report = checkpoint.read_screen(fingerprint, sla)
+        if report is None:
+            try:
+                report = screen_config(params, sla)
             except Exception as e:
-                print(f"    Ошибка в симуляции с конфигурацией {i + 1}, запуск {run_num + 1}: {e}")
-                config_results['runs'].append({
-                    'run_id': run_num + 1,
-                    'error': str(e)
-                })
-
-        results.append(config_results)
-
-    # Средние для каждой конфигурации
-    averaged_results = []
-    for config_result in results:
-        avg_stats = None
-        runs_with_stats = [r for r in config_result['runs'] if 'statistics' in r and r['statistics'] is not None]
-
-        if runs_with_stats:
-            first_run_stats = runs_with_stats[0]['statistics']
-            avg_stats = {}
-            for key, value in first_run_stats.items():
-                if isinstance(value, (int, float)):
-                    avg_val = statistics.mean(
-                        [r['statistics'][key] for r in runs_with_stats if r['statistics'] is not None])
-                    avg_stats[key] = avg_val
-                elif isinstance(value, dict):
-                    avg_dict = {}
-                    for sub_key, sub_value in value.items():
-                        if isinstance(sub_value, (int, float)):
-                            avg_sub_val = statistics.mean(
-                                [r['statistics'][key][sub_key] for r in runs_with_stats if r['statistics'] is not None])
-                            avg_dict[sub_key] = avg_sub_val
-                        else:
-                            avg_dict[sub_key] = sub_value
-                    avg_stats[key] = avg_dict
+                report = {'verdict': 'error', 'error': str(e)}
+            checkpoint.append_screen(fingerprint, sla, report)
+        return report
+
+    def excluded(params, fingerprint):
+        # Ошибка самой проверки - не повод отказываться от моделирования
+        return screen == 'skip' and screened(params, fingerprint)['verdict'] in ('unstable', 'sla')
+
+    def screen_out(i, params, fingerprint):
+        """Проверка перед моделированием: предупреждает о конфигурации и решает, пропустить ли ее."""
+        report = screened(params, fingerprint)
+        if report is None or report['verdict'] == 'ok':
+            return False
+        if report['verdict'] == 'error':
+            warning = f"аналитическая проверка не выполнена: {report['error']}"
+        elif report['verdict'] == 'unstable':
+            bottleneck = report['stations'][report['bottleneck']]
+            warning = (f"аналитическая проверка: неустойчива, загрузка {report['bottleneck']} "
+                       f"{bottleneck['utilization']:.2f}")
+        else:
+            warning = (f"аналитическая проверка: прогноз времени пребывания "
+                       f"{report['predicted_wait_time']:.1f} мин при SLA {sla} мин")
+        skip = excluded(params, fingerprint)
+        print(f"  Конфигурация {i + 1}/{total_configs}: {warning}" + (", не моделируется" if skip else ""))
+        return skip
+
+    print(f"Запуск grid search с {total_configs} настройками...")
+    if constraints:
+        print(f"Ограничений: {len(constraints)}, отсечено настроек: "
+              f"{count_grid_combinations(grid_params) - total_configs}")
+    print(f"Корневое зерно: {root_seed}")
+    if random_root and cache:
+        # Зерна запусков выводятся из корневого, поэтому с новым зерном кэш не срабатывает
+        print(f"Корневое зерно выбрано случайно: для повторного использования результатов "
+              f"из кэша запускайте grid search с --seed {root_seed}")
+    if workers > 1:
+        print(f"Используется процессов: {workers}")
+    if crn:
+        print("Режим общих случайных чисел (CRN)")
+    if len(checkpoint):
+        print(f"Контрольная точка '{GRID_CHECKPOINT_FILE}': записано запусков {len(checkpoint)}")
+    if checkpoint.failed:
+        print(f"Запуски с ошибкой из контрольной точки ({checkpoint.failed}) будут выполнены снова")
+
+    try:
+        min_runs = max(num_runs_per_config, 2)
+        if precision is not None:
+            print(f"Последовательные повторы: от {min_runs} до {max_runs}, "
+                  f"цель - относительная полуширина {precision:.1%} ({SEQUENTIAL_CONFIDENCE:.0%} интервал)")
+            _run_sequential_grid(enumerate(combinations()), min_runs, max_runs, precision, root_seed,
+                                 checkpoint, workers, crn, engine, cache, screen_out)
+        else:
+            skipped = 0
+            pending = collections.deque()  # (конфигурация, отпечаток) выданных задач по порядку
+
+            def tasks():
+                nonlocal skipped
+                for i, params in enumerate(combinations()):
+                    fingerprint = params_fingerprint(params, engine)
+                    if screen_out(i, params, fingerprint):
+                        continue
+                    for run_id in range(1, num_runs_per_config + 1):
+                        seed = _grid_seed(root_seed, params, run_id, crn)
+                        if (fingerprint, run_id, seed) in checkpoint:
+                            skipped += 1
+                            continue
+                        if skipped and not pending:
+                            print(f"Пропущено выполненных ранее запусков: {skipped}")
+                            skipped = 0
+                        pending.append((i, fingerprint))
+                        yield i, run_id, params, seed, engine, cache
+
+            for run in _iter_grid_runs(tasks(), workers):
+                i, fingerprint = pending.popleft()
+                print(f"  Конфигурация {i + 1}/{total_configs}, запуск {run['run_id']}/{num_runs_per_config}")
+                if 'error' in run:
+                    print(f"    Ошибка в симуляции с конфигурацией {i + 1}, запуск {run['run_id']}: {run['error']}")
+                checkpoint.append(fingerprint, run)
+            if skipped:
+                print(f"Пропущено выполненных ранее запусков: {skipped}")
+
+        screened_out = 0
+
+        def averaged_results():
+            """Средние для каждой конфигурации: запуски читаются из контрольной точки."""
+            nonlocal screened_out
+            for i, params in enumerate(combinations()):
+                print(f"\n--- Конфигурация {i + 1}/{total_configs} ---")
+                print(f"Параметры: {params}")
+                fingerprint = params_fingerprint(params, engine)
+                # Предупреждения проверки напечатаны до моделирования, здесь оценка только сохраняется
+                report = screened(params, fingerprint)
+
+                def read(run_id):
+                    return checkpoint.read((fingerprint, run_id, _grid_seed(root_seed, params, run_id, crn)))
+
+                summary = None
+                if excluded(params, fingerprint):
+                    print("  Не моделировалась")
+                    screened_out += 1
+                    runs = []
+                elif precision is not None:
+                    runs, summary = _sequential_series(read, min_runs, max_runs, precision)
                 else:
-                    avg_stats[key] = value
+                    runs = [read(run_id) for run_id in range(1, num_runs_per_config + 1)]
+                failed = sum('error' in run for run in runs)
+                if failed:
+                    print(f"  Запусков с ошибкой: {failed} из {len(runs)}")
+                columns = RunColumns([r['seed'] for r in runs], [r.get('statistics') for r in runs])
+                averaged = {
+                    'parameters': params,
+                    'averaged_statistics': columns.mean(),
+                    'individual_runs': runs
+                }
+                if summary is not None:
+                    status = "достигнута" if summary['converged'] else "не достигнута"
+                    print(f"  Точность {status} за {summary['runs']} запусков:")
+                    for key, metric in summary['half_width'].items():
+                        print(f"    {key}: {metric['mean']:.4f} ± {metric['half_width']:.4f} ({metric['relative']:.2%})")
+                    averaged['replications'] = summary
+                if report is not None:
+                    averaged['screen'] = report
+                yield averaged
+
+        # Сохранение
+        output_file = "grid_search_results.json"
+        _write_json_array(output_file, averaged_results())
+    finally:
+        checkpoint.close()
+    if screened_out:
+        print(f"\nНе моделировалось по аналитической проверке: {screened_out} из {total_configs}")
+    print(f"\nGrid search results saved to '{output_file}'")
+    return output_file
 
-        averaged_results.append({
-            'parameters': config_result['parameters'],
-            'averaged_statistics': avg_stats,
-            'individual_runs': config_result['runs']
-        })
 
-    # Сохранение
-    output_file = "grid_search_results.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(averaged_results, f, indent=2, ensure_ascii=False)
-    print(f"\nGrid search results saved to '{output_file}'")
-    return averaged_results
+def _run_experiment(params: Dict[str, Any], seed: int, engine: str = None, cache: bool = True) -> Dict[str, Any]:
+    """
+    Выполняет один эксперимент batch и замеряет его wall-clock время (секунды).
+    """
+    started = time.perf_counter()
+    try:
+        stats, used_params = run_simulation_with_params(params, seed, engine, cache)
+        result = {'parameters': used_params, 'seed': seed, 'statistics': stats}
+    except Exception as e:
+        result = {'parameters': params, 'seed': seed, 'error': str(e)}
+    result['wall_time'] = time.perf_counter() - started
+    return result
 
 
-def run_batch_experiments(json_file_path: str):
+def _experiment_worker(conn, params: Dict[str, Any], seed: int, engine: str = None, cache: bool = True) -> None:
+    """Точка входа дочернего процесса: результат эксперимента отправляется через pipe."""
+    conn.send(_run_experiment(params, seed, engine, cache))
+    conn.close()
+
+
+def _iter_isolated_experiments(batch_params: List[Dict[str, Any]], seeds: List[int], workers: int,
+                               timeout: float = None, engine: str = None, cache: bool = True) -> Iterator[tuple]:
+    """
+    Запускает эксперименты в отдельных процессах, не более workers одновременно.
+    Отдает пары (индекс, результат) по мере завершения. Упавший процесс или
+    эксперимент, превысивший timeout секунд, превращается в запись с 'error',
+    остальная часть batch продолжает выполняться.
+    """
+    ctx = multiprocessing.get_context()
+    pending = collections.deque(enumerate(batch_params))
+    running = {}  # conn -> (индекс, процесс, время старта)
+
+    while pending or running:
+        while pending and len(running) < workers:
+            i, params = pending.popleft()
+            recv_conn, send_conn = ctx.Pipe(duplex=False)
+            process = ctx.Process(target=_experiment_worker, args=(send_conn, params, seeds[i], engine, cache),
+                                  daemon=True)
+            process.start()
+            send_conn.close()
+            running[recv_conn] = (i, process, time.perf_counter())
+
+        wait_timeout = None
+        if timeout is not None:
+            earliest_start = min(started for _, _, started in running.values())
+            wait_timeout = max(0.0, earliest_start + timeout - time.perf_counter())
+
+        for conn in multiprocessing.connection.wait(list(running), timeout=wait_timeout):
+            i, process, started = running.pop(conn)
+            try:
+                result = conn.recv()
+            except EOFError:
+                process.join()
+                result = {
+                    'parameters': batch_params[i],
+                    'seed': seeds[i],
+                    'error': f"процесс эксперимента завершился аварийно (код {process.exitcode})",
+                    'wall_time': time.perf_counter() - started
+                }
+            conn.close()
+            process.join()
+            yield i, result
+
+        if timeout is not None:
+            now = time.perf_counter()
+            for conn, (i, process, started) in list(running.items()):
+                if now - started >= timeout:
+                    process.kill()
+                    process.join()
+                    conn.close()
+                    del running[conn]
+                    yield i, {
+                        'parameters': batch_params[i],
+                        'seed': seeds[i],
+                        'error': f"превышен лимит времени {timeout} с",
+                        'wall_time': now - started
+                    }
+
+
+def run_batch_experiments(json_file_path: str, workers: int = 1, timeout: float = None,
+                          root_seed: int = None, engine: str = None, cache: bool = True):
     """
     Запуск экспериментов из batch json.
+    При workers > 1 или заданном timeout каждый эксперимент выполняется в отдельном
+    процессе, так что падение или зависание одного сценария не прерывает batch.
+    Эксперимент i получает зерно из своего 'seed', иначе derive_run_seed(root_seed, i, 1).
+    cache=False отключает кэш результатов (см. run_simulation_with_params).
     """
     with open(json_file_path, 'r', encoding='utf-8') as f:
         batch_params = json.load(f)
@@ -500,23 +1575,23 @@ def run_batch_experiments(json_file_path: str):
         print("Error: Batch JSON должен иметь список словарей параметров.")
         return
 
+    if root_seed is None:
+        root_seed = new_root_seed()
+    print(f"Корневое зерно: {root_seed}")
+    seeds = [params.get('seed', derive_run_seed(root_seed, i, 1)) for i, params in enumerate(batch_params)]
+
+    if workers > 1 or timeout is not None:
+        experiments = _iter_isolated_experiments(batch_params, seeds, workers, timeout, engine, cache)
+    else:
+        experiments = ((i, _run_experiment(params, seeds[i], engine, cache)) for i, params in enumerate(batch_params))
+
     results = []
-    for i, params in enumerate(batch_params):
-        print(f"\n--- Запуск эксперимента {i + 1}/{len(batch_params)} ---")
-        try:
-            stats, used_params = run_simulation_with_params(params)
-            results.append({
-                'experiment_id': i + 1,
-                'parameters': used_params,
-                'statistics': stats
-            })
-        except Exception as e:
-            print(f"Ошибка при выполнении эксперимента {i + 1}: {e}")
-            results.append({
-                'experiment_id': i + 1,
-                'parameters': params,
-                'error': str(e)
-            })
+    for i, result in experiments:
+        print(f"\n--- Эксперимент {i + 1}/{len(batch_params)} завершен за {result['wall_time']:.2f} с ---")
+        if 'error' in result:
+            print(f"Ошибка при выполнении эксперимента {i + 1}: {result['error']}")
+        results.append({'experiment_id': i + 1, **result})
+    results.sort(key=lambda r: r['experiment_id'])
 
     output_file = "batch_results.json"
     with open(output_file, 'w', encoding='utf-8') as f:
@@ -524,32 +1599,130 @@ def run_batch_experiments(json_file_path: str):
     print(f"\nBatch experiment results saved to '{output_file}'")
 
 
+def run_benchmark(json_file_path: str, repeat: int = 3, seed: int = None, engine: str = None):
+    """
+    Замер производительности симулятора на одной конфигурации: лучшее время
+    из repeat запусков с одним зерном, число событий и событий/пассажиров в секунду.
+    """
+    params = load_params_from_json(json_file_path)
+    if seed is None:
+        seed = params.get('seed', new_root_seed())
+
+    timings = []
+    stats = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        stats, used_params = run_simulation_with_params(params, seed, engine, cache=False)
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+
+    print(f"Конфигурация: {json_file_path}, движок: {engine or params.get('engine', 'simpy')}, "
+          f"зерно: {seed}, запусков: {repeat}")
+    print(f"Лучшее время запуска: {best:.3f} с (среднее {statistics.mean(timings):.3f} с)")
+    if stats:
+        if 'event_count' in stats:
+            # Векторный движок не моделирует события по одному
+            print(f"Событий за запуск: {stats['event_count']}")
+            print(f"Пиковый размер кучи событий при прибытиях: {stats['peak_event_queue_at_arrivals']}")
+            print(f"Событий в секунду: {stats['event_count'] / best:,.0f}")
+        print(f"Пассажиров в секунду: {stats['generated_passengers'] / best:,.0f}")
+    return best, stats
+
+
+def _pop_option(argv: List[str], name: str, default: Any = None, cast=str) -> Any:
+    """
+    Извлекает из argv опцию вида `--name value` и возвращает её значение,
+    удаляя оба элемента, чтобы позиционные аргументы остались на своих местах.
+    """
+    if name not in argv:
+        return default
+    idx = argv.index(name)
+    if idx + 1 >= len(argv):
+        raise ValueError(f"Option {name} requires a value")
+    value = argv[idx + 1]
+    del argv[idx:idx + 2]
+    return cast(value)
+
+
+def _pop_flag(argv: List[str], name: str) -> bool:
+    """Извлекает из argv флаг без значения и сообщает, был ли он указан."""
+    if name not in argv:
+        return False
+    argv.remove(name)
+    return True
+
+
 def main():
     import sys
 
-    if len(sys.argv) < 2:
+    argv = list(sys.argv)
+    workers = _pop_option(argv, '--workers', 1, int)
+    repeat = _pop_option(argv, '--repeat', 3, int)
+    timeout = _pop_option(argv, '--timeout', None, float)
+    seed = _pop_option(argv, '--seed', None, int)
+    crn = _pop_flag(argv, '--crn')
+    fresh = _pop_flag(argv, '--fresh')
+    cache = not _pop_flag(argv, '--no-cache')
+    engine = _pop_option(argv, '--engine', None)
+    precision = _pop_option(argv, '--precision', None, float)
+    max_runs = _pop_option(argv, '--max-runs', 100, int)
+    batch_means = _pop_option(argv, '--batch-means', None, int)
+    screen = _pop_option(argv, '--screen', None)
+    sla = _pop_option(argv, '--sla', None, float)
+
+    if len(argv) < 2:
         print("Usage:")
-        print("  python airport_simulator.py single <config_file.json>")
-        print("  python airport_simulator.py batch <batch_config.json>")
-        print("  python airport_simulator.py grid <base_config.json> <grid_config.json> [num_runs_per_config]")
+        print("  python airport_simulator.py single <config_file.json> [--seed N] [--batch-means K] [--no-cache]")
+        print("  python airport_simulator.py batch <batch_config.json> [--workers N] [--timeout SECONDS] [--no-cache]")
+        print("  python airport_simulator.py bench <config_file.json> [--repeat R] [--seed N]")
+        print("  python airport_simulator.py grid <base_config.json> <grid_config.json> [num_runs_per_config] [--workers N] [--crn] [--precision REL] [--max-runs N] [--batch-means K] [--fresh] [--no-cache] [--screen flag|skip] [--sla MINUTES]")
         print("  - single: Run a single simulation.")
         print("  - batch: Run a list of simulations from a batch file.")
         print("  - grid: Run a grid search using base and grid config files.")
+        print("  - bench: Measure run time and events/sec of a single configuration.")
+        print("  - grid_config.json may hold \"constraints\": a list of {\"sum\": [paths] or {path: weight}, \"min\"/\"max\": N}")
+        print("    or {\"left\": path, \"op\": \"<=\", \"right\": path or N}; infeasible configurations are never run.")
         print("  - num_runs_per_config: Optional, number of runs per configuration for averaging (default 1).")
+        print("  - --workers N: Optional, number of worker processes (default 1, serial).")
+        print("  - --timeout SECONDS: Optional, per-experiment time limit for batch mode.")
+        print("  - --seed N: Optional, run seed for single, root seed for batch/grid (default: random).")
+        print("  - --crn: Optional, use common random numbers across grid configurations.")
+        print("  - --engine simpy|fast|vector: Optional, simulation engine (default simpy; vector requires no reneging).")
+        print("  - --precision REL: Optional, add grid runs per configuration until the 95% CI half-width of")
+        print("    avg_wait_time and absolute_throughput is within REL of the mean (num_runs_per_config is the minimum).")
+        print("  - --max-runs N: Optional, upper limit of runs per configuration with --precision (default 100).")
+        print("  - --no-cache: Optional, always simulate instead of reusing results stored in .result_cache/")
+        print("    (single, batch and grid; keyed by params, seed, engine and simulator version). Grid run seeds depend on")
+        print("    the root seed and the combination's params, not its position, so re-running an extended grid with the")
+        print("    same --seed simulates only the new combinations.")
+        print("  - --screen flag|skip: Optional, analytic pre-screen of grid configurations (utilization per station,")
+        print("    Erlang-C / Allen-Cunneen waits): flag or skip unstable ones and those far above --sla;")
+        print("    configurations the screen cannot evaluate are reported and still simulated.")
+        print("  - --sla MINUTES: Optional, target average time in the airport for --screen.")
+        print("  - --fresh: Optional, ignore the grid checkpoint (grid_search_results.jsonl) and start over;")
+        print("    by default finished grid runs recorded there are skipped.")
+        print("  - --batch-means K: Optional, analyse each long run by K non-overlapping time batches after the warm-up")
+        print("    (MSER-5 on the same run unless 'warmup' is set): batch-means CI and lag-1 autocorrelation of every")
+        print("    metric, including utilization, queue lengths and stage waits. Grid makes one run per configuration.")
         sys.exit(1)
 
-    command = sys.argv[1]
+    command = argv[1]
 
     if command == 'single':
-        if len(sys.argv) < 3:
-            print("Usage: python airport_simulator.py single <config_file.json>")
+        if len(argv) < 3:
+            print("Usage: python airport_simulator.py single <config_file.json> [--seed N] [--batch-means K]")
             sys.exit(1)
-        json_file_path = sys.argv[2]
+        json_file_path = argv[2]
         params = load_params_from_json(json_file_path)
-        stats, used_params = run_simulation_with_params(params)
+        if batch_means is not None:
+            params['batch_means'] = batch_means
+        if seed is None:
+            seed = params.get('seed', new_root_seed())
+        stats, used_params = run_simulation_with_params(params, seed, engine, cache)
         print("\n" + "=" * 60)
         print("РЕЗУЛЬТАТЫ МОДЕЛИРОВАНИЯ АЭРОПОРТА")
         print("=" * 60)
+        print(f"Зерно запуска: {seed}")
         if stats:
             mins, secs = divmod(stats['avg_wait_time'], 1)
             secs = secs * 60
@@ -563,27 +1736,53 @@ def main():
             print("\nКоэффициенты использования ресурсов:")
             for service, util in stats['utilization'].items():
                 print(f"  {service:15s}: {util:.2%}")
+            print("\nРесурсы (загрузка, средняя / наибольшая очередь):")
+            for name, monitor in stats['resources'].items():
+                print(f"  {name:15s}: {monitor['utilization']:.2%}, "
+                      f"{monitor['avg_queue_length']:.2f} / {monitor['max_queue_length']}")
+            print("\nЭтапы (ожидание в очереди: среднее / p95, обслуживание, ушли по таймауту), мин:")
+            for name, stage in stats['stages'].items():
+                print(f"  {name:15s}: {stage['queue_wait_mean']:.2f} / {stage['queue_wait_p95']:.2f}, "
+                      f"{stage['service_mean']:.2f}, {stage['renege_count']}")
+            if 'warmup' in stats:
+                print(f"\nРазогрев ({stats['warmup']['method']}): первые {stats['warmup']['time']:.2f} мин не учтены")
+            if 'batch_means' in stats:
+                report = stats['batch_means']
+                print(f"\nГрупповые средние ({report['batches']} групп, {report['confidence']:.0%} интервал):")
+                width = max(map(len, report['metrics']), default=0)
+                for name, metric in report['metrics'].items():
+                    print(f"  {name:{width}s}: {metric['mean']:.4f} ± {metric['half_width']:.4f}, "
+                          f"автокорреляция lag-1 {metric['lag1_autocorrelation']:+.2f}")
         else:
             print("Недостаточно данных для статистики")
 
     elif command == 'batch':
-        if len(sys.argv) < 3:
-            print("Usage: python airport_simulator.py batch <batch_config.json>")
+        if len(argv) < 3:
+            print("Usage: python airport_simulator.py batch <batch_config.json> [--workers N] [--timeout SECONDS]")
+            sys.exit(1)
+        json_file_path = argv[2]
+        run_batch_experiments(json_file_path, workers, timeout, seed, engine, cache)
+
+    elif command == 'bench':
+        if len(argv) < 3:
+            print("Usage: python airport_simulator.py bench <config_file.json> [--repeat R] [--seed N]")
             sys.exit(1)
-        json_file_path = sys.argv[2]
-        run_batch_experiments(json_file_path)
+        run_benchmark(argv[2], repeat, seed, engine)
 
     elif command == 'grid':
-        if len(sys.argv) < 4:
-            print("Usage: python airport_simulator.py grid <base_config.json> <grid_config.json> [num_runs_per_config]")
+        if len(argv) < 4:
+            print("Usage: python airport_simulator.py grid <base_config.json> <grid_config.json> [num_runs_per_config] "
+                  "[--workers N] [--crn] [--precision REL] [--max-runs N] [--batch-means K] [--fresh] [--no-cache] "
+                  "[--screen flag|skip] [--sla MINUTES]")
             sys.exit(1)
-        base_config_path = sys.argv[2]
-        grid_config_path = sys.argv[3]
-        num_runs = int(sys.argv[4]) if len(sys.argv) > 4 else 1
-        run_grid_search(base_config_path, grid_config_path, num_runs)
+        base_config_path = argv[2]
+        grid_config_path = argv[3]
+        num_runs = int(argv[4]) if len(argv) > 4 else 1
+        run_grid_search(base_config_path, grid_config_path, num_runs, workers, seed, crn, engine,
+                        precision, max_runs, batch_means, fresh, cache, screen, sla)
 
     else:
-        print("Invalid command. Use 'single', 'batch', or 'grid'.")
+        print("Invalid command. Use 'single', 'batch', 'grid' or 'bench'.")
         sys.exit(1)
 
 
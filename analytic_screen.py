@@ -0,0 +1,115 @@
+import math
+from typing import Dict, Any
+
+from airport_model import build_route, route_resource_counts
+
+# Число мест багажа - int(random() * 4), равномерно на {0, 1, 2, 3}
+BAG_MEAN = 1.5
+BAG_VARIANCE = 1.25
+# Во сколько раз прогноз среднего времени пребывания должен превышать SLA,
+# чтобы конфигурация считалась безнадежной (запас на погрешность приближений)
+SLA_FACTOR = 2.0
+
+
+def erlang_c(servers: int, load: float) -> float:
+    """
+    Вероятность ожидания в M/M/c (формула Эрланга C) при c = servers и
+    предлагаемой нагрузке load = lambda * E[S]. Считается через устойчивую
+    рекуррентность Эрланга B; 1 при load >= servers.
+    """
+    if load >= servers:
+        return 1.0
+    blocking = 1.0
+    for k in range(1, servers + 1):
+        blocking = load * blocking / (k + load * blocking)
+    return servers * blocking / (servers - load * (1 - blocking))
+
+
+def allen_cunneen_wait(servers: int, load: float, mean_service: float, arrival_scv: float,
+                       service_scv: float) -> float:
+    """
+    Среднее ожидание в очереди G/G/c по приближению Аллена-Каннеена:
+    ожидание M/M/c, умноженное на (ca^2 + cs^2) / 2 (квадраты коэффициентов
+    вариации интервалов прихода и обслуживания). inf для неустойчивой станции.
+    """
+    if load >= servers:
+        return math.inf
+    return erlang_c(servers, load) * mean_service / (servers - load) * (arrival_scv + service_scv) / 2
+
+
+def screen_config(params: Dict[str, Any], sla: float = None) -> Dict[str, Any]:
+    """
+    Аналитическая оценка конфигурации без моделирования. Для каждой станции
+    (ресурса) - предлагаемая нагрузка a = lambda * p * E[S] (сумма по этапам
+    станции), загрузка rho = a / c и ожидание по Аллену-Каннеену. Изменчивость
+    потока передается по маршруту как в QNA: прореживание с вероятностью
+    посещения и формула Уитта для выходящего потока; для станций нескольких
+    этапов поток приходов считается пуассоновским. Прогноз среднего времени
+    пребывания - сумма p * (ожидание + обслуживание) по этапам.
+    verdict: 'unstable' - rho >= 1 хотя бы на одной станции, 'sla' - прогноз
+    больше SLA_FACTOR * sla, иначе 'ok'.
+    """
+    route = build_route(params)
+    resource_counts = route_resource_counts(params, route)
+    arrival_rate = 1.0 / params['passenger_arrival_rate']
+
+    # Моменты длительности обслуживания этапов и их сумма по станциям
+    moments = []
+    stations = {}
+    for spec in route:
+        low, high = spec.service_time
+        mean = (low + high) / 2 + BAG_MEAN * spec.per_bag
+        variance = (high - low) ** 2 / 12 + BAG_VARIANCE * spec.per_bag ** 2
+        moments.append((mean, variance))
+        rate = arrival_rate * spec.probability
+        station = stations.setdefault(spec.resource, {'rate': 0.0, 'load': 0.0, 'second': 0.0, 'stages': 0})
+        station['rate'] += rate
+        station['load'] += rate * mean
+        station['second'] += rate * (variance + mean * mean)
+        station['stages'] += 1
+
+    report = {}
+    flow_scv = 1.0  # пуассоновский поток появления пассажиров
+    predicted = 0.0
+    for spec, (mean, variance) in zip(route, moments):
+        station = stations[spec.resource]
+        servers = resource_counts[spec.resource]
+        p = spec.probability
+        arrival_scv = p * flow_scv + (1 - p)
+        if spec.resource not in report:
+            load = station['load']
+            station_mean = load / station['rate'] if station['rate'] else 0.0
+            station_scv = (station['second'] / station['rate'] / station_mean ** 2 - 1) if station_mean else 0.0
+            station_arrival_scv = arrival_scv if station['stages'] == 1 else 1.0
+            report[spec.resource] = {
+                'offered_load': load,
+                'utilization': load / servers if servers > 0 else math.inf,
+                'queue_wait': allen_cunneen_wait(servers, load, station_mean, station_arrival_scv, station_scv),
+            }
+        utilization = report[spec.resource]['utilization']
+        predicted += p * (report[spec.resource]['queue_wait'] + mean)
+        if utilization < 1:
+            service_scv = variance / mean ** 2 if mean else 0.0
+            servers_root = math.sqrt(servers)
+            departure_scv = (1 + (1 - utilization ** 2) * (arrival_scv - 1)
+                             + utilization ** 2 * (service_scv - 1) / servers_root)
+            flow_scv = p * departure_scv + (1 - p) * flow_scv
+
+    bottleneck = max(report, key=lambda name: report[name]['utilization'])
+    if report[bottleneck]['utilization'] >= 1:
+        verdict = 'unstable'
+    elif sla is not None and predicted > SLA_FACTOR * sla:
+        verdict = 'sla'
+    else:
+        verdict = 'ok'
+
+    def finite(value):
+        return value if math.isfinite(value) else None
+
+    return {
+        'verdict': verdict,
+        'predicted_wait_time': finite(predicted),
+        'bottleneck': bottleneck,
+        'stations': {name: {key: finite(value) for key, value in station.items()}
+                     for name, station in report.items()},
+    }
@@ -0,0 +1,398 @@
+import math
+from array import array
+from statistics import NormalDist
+from typing import Dict, Any
+
+import numpy as np
+
+
+class RunningStats(object):
+    """
+    Потоковый накопитель count/mean/variance/min/max по алгоритму Уэлфорда.
+    Память постоянна и не зависит от числа наблюдений.
+    """
+
+    __slots__ = ('count', 'mean', '_m2', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x: float) -> None:
+        """Добавляет одно наблюдение."""
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        self.total += x
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    def extend(self, values) -> None:
+        """
+        Добавляет блок наблюдений (последовательность или массив NumPy) за один
+        шаг: статистики блока считаются векторно и объединяются с накопленными
+        по формуле Чана.
+        """
+        values = np.asarray(values, dtype=float)
+        n = values.size
+        if not n:
+            return
+        mean = float(values.mean())
+        m2 = float(((values - mean) ** 2).sum())
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self._m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.total += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other: 'RunningStats') -> None:
+        """Добавляет наблюдения другого накопителя (формула Чана)."""
+        if not other.count:
+            return
+        if not self.count:
+            self.count, self.mean, self._m2 = other.count, other.mean, other._m2
+            self.total, self.min, self.max = other.total, other.min, other.max
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self._m2 += other._m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @staticmethod
+    def extend_groups(accumulators, values, offsets) -> None:
+        """
+        Добавляет в accumulators[j] блок values[offsets[j]:offsets[j + 1]]
+        (values сгруппированы по порядку накопителей, offsets[-1] = len(values)):
+        статистики всех блоков считаются векторно и объединяются с накопленными.
+        """
+        values = np.asarray(values, dtype=float)
+        sizes = np.diff(offsets)
+        filled = np.flatnonzero(sizes)
+        if not filled.size:
+            return
+        starts = np.asarray(offsets)[filled]
+        counts = sizes[filled]
+        totals = np.add.reduceat(values, starts)
+        means = totals / counts
+        deviations = values - np.repeat(means, counts)
+        m2 = np.add.reduceat(deviations * deviations, starts)
+        lows = np.minimum.reduceat(values, starts)
+        highs = np.maximum.reduceat(values, starts)
+        for i, j in enumerate(filled.tolist()):
+            block = RunningStats()
+            block.count = int(counts[i])
+            block.mean = float(means[i])
+            block._m2 = float(m2[i])
+            block.total = float(totals[i])
+            block.min = float(lows[i])
+            block.max = float(highs[i])
+            accumulators[j].merge(block)
+
+    @property
+    def variance(self) -> float:
+        """Несмещенная выборочная дисперсия (0 при менее чем двух наблюдениях)."""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self) -> float:
+        return math.sqrt(self.variance)
+
+    def half_width(self, confidence: float = 0.95) -> float:
+        """Полуширина доверительного интервала среднего по t-распределению (inf при менее чем двух наблюдениях)."""
+        if self.count < 2:
+            return math.inf
+        return student_t_quantile((1 + confidence) / 2, self.count - 1) * self.stdev / math.sqrt(self.count)
+
+    def __repr__(self):
+        return f"RunningStats(count={self.count}, mean={self.mean}, stdev={self.stdev})"
+
+
+def student_t_quantile(p: float, df: int) -> float:
+    """
+    Квантиль уровня p распределения Стьюдента с df степенями свободы.
+    Для df 1 и 2 - точные формулы, иначе разложение Корниша-Фишера по
+    квантилю нормального распределения (погрешность < 0.01 уже при df = 3).
+    """
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = NormalDist().inv_cdf(p)
+    z2 = z * z
+    terms = (
+        z * (z2 + 1) / 4,
+        z * ((5 * z2 + 16) * z2 + 3) / 96,
+        z * (((3 * z2 + 19) * z2 + 17) * z2 - 15) / 384,
+        z * ((((79 * z2 + 776) * z2 + 1482) * z2 - 1920) * z2 - 945) / 92160,
+    )
+    return z + sum(term / df ** (k + 1) for k, term in enumerate(terms))
+
+
+class TimeWeighted(object):
+    """
+    Кусочно-постоянный во времени уровень (занятые каналы, длина очереди,
+    число пассажиров в системе). Интеграл и максимум обновляются только
+    в моменты изменения уровня.
+    """
+
+    __slots__ = ('level', 'area', 'since', 'max')
+
+    def __init__(self, start: float = 0.0):
+        self.level = 0
+        self.area = 0.0
+        self.since = start
+        self.max = 0
+
+    def update(self, now: float, level: int) -> None:
+        """Уровень становится равен level начиная с момента now."""
+        self.area += self.level * (now - self.since)
+        self.since = now
+        self.level = level
+        if level > self.max:
+            self.max = level
+
+    def integral(self, until: float) -> float:
+        """Интеграл уровня от начала до момента until (не раньше последнего изменения)."""
+        return self.area + self.level * (until - self.since)
+
+    def __repr__(self):
+        return f"TimeWeighted(level={self.level}, area={self.area}, max={self.max})"
+
+
+class QuantileSketch(object):
+    """
+    Гистограмма с логарифмическими корзинами для квантилей потока значений >= 0.
+    Значение x > 0 попадает в корзину k = ceil(log(x) / log(gamma)),
+    gamma = (1 + a) / (1 - a), a - относительная точность: квантиль
+    возвращается как середина корзины с относительной погрешностью не более a.
+    Нули и значения не больше MIN_VALUE считаются отдельно. Память зависит
+    только от диапазона значений, а не от их числа.
+    """
+
+    __slots__ = ('relative_accuracy', '_gamma', '_log_gamma', 'count', 'total', 'zero_count', 'bins')
+
+    MIN_VALUE = 1e-9
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.count = 0
+        self.total = 0.0
+        self.zero_count = 0
+        self.bins = {}
+
+    def add(self, x: float, count: int = 1) -> None:
+        """Добавляет значение x count раз."""
+        self.count += count
+        self.total += x * count
+        if x <= self.MIN_VALUE:
+            self.zero_count += count
+            return
+        k = math.ceil(math.log(x) / self._log_gamma)
+        self.bins[k] = self.bins.get(k, 0) + count
+
+    def extend(self, values) -> None:
+        """Добавляет блок значений (последовательность или массив NumPy), корзины считаются векторно."""
+        values = np.asarray(values, dtype=float)
+        positive = values[values > self.MIN_VALUE]
+        self.count += values.size
+        self.total += float(values.sum())
+        self.zero_count += values.size - positive.size
+        keys, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64),
+                                 return_counts=True)
+        bins = self.bins
+        for k, c in zip(keys.tolist(), counts.tolist()):
+            bins[k] = bins.get(k, 0) + c
+
+    @staticmethod
+    def extend_groups(sketches, values, offsets) -> None:
+        """
+        Добавляет в sketches[j] блок values[offsets[j]:offsets[j + 1]] (как
+        RunningStats.extend_groups); корзины всех блоков считаются за один
+        векторный проход. Точность всех гистограмм должна совпадать.
+        """
+        values = np.asarray(values, dtype=float)
+        sizes = np.diff(offsets)
+        group = np.repeat(np.arange(sizes.size), sizes)
+        positive = values > QuantileSketch.MIN_VALUE
+        totals = np.bincount(group, weights=values, minlength=sizes.size)
+        zeros = np.bincount(group[~positive], minlength=sizes.size)
+        for j in np.flatnonzero(sizes).tolist():
+            sketch = sketches[j]
+            sketch.count += int(sizes[j])
+            sketch.total += float(totals[j])
+            sketch.zero_count += int(zeros[j])
+        keys = np.ceil(np.log(values[positive]) / sketches[0]._log_gamma).astype(np.int64)
+        if not keys.size:
+            return
+        # Пара (блок, корзина) кодируется одним числом, и np.unique считает все пары сразу
+        low = int(keys.min())
+        width = int(keys.max()) - low + 1
+        pairs, counts = np.unique(group[positive] * width + (keys - low), return_counts=True)
+        for pair, c in zip(pairs.tolist(), counts.tolist()):
+            j, k = divmod(pair, width)
+            bins = sketches[j].bins
+            bins[k + low] = bins.get(k + low, 0) + c
+
+    def merge(self, other: 'QuantileSketch') -> None:
+        """Добавляет к гистограмме другую с той же точностью (например, другого запуска)."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Объединять можно только гистограммы с одинаковой точностью")
+        self.count += other.count
+        self.total += other.total
+        self.zero_count += other.zero_count
+        bins = self.bins
+        for k, c in other.bins.items():
+            bins[k] = bins.get(k, 0) + c
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Представление для JSON (ключи корзин - строки)."""
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'count': self.count,
+            'total': self.total,
+            'zero_count': self.zero_count,
+            'bins': {str(k): c for k, c in sorted(self.bins.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'QuantileSketch':
+        sketch = cls(data['relative_accuracy'])
+        sketch.count = data['count']
+        sketch.total = data['total']
+        sketch.zero_count = data['zero_count']
+        sketch.bins = {int(k): c for k, c in data['bins'].items()}
+        return sketch
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Квантиль уровня q (0..1); 0 для пустой гистограммы."""
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        cumulative = self.zero_count
+        if rank < cumulative:
+            return 0.0
+        for k in sorted(self.bins):
+            cumulative += self.bins[k]
+            if rank < cumulative:
+                return 2 * self._gamma ** k / (self._gamma + 1)
+        return 2 * self._gamma ** max(self.bins) / (self._gamma + 1)
+
+    def __repr__(self):
+        return f"QuantileSketch(count={self.count}, bins={len(self.bins)}, a={self.relative_accuracy})"
+
+
+class BatchSeries(object):
+    """
+    Компактный ряд групповых средних потока наблюдений (момент, значение):
+    для каждых batch_size подряд идущих значений хранятся их среднее и момент
+    первого наблюдения группы (массивы array('d'), 16 байт на группу).
+    Незавершенная последняя группа в ряд не входит.
+    """
+
+    __slots__ = ('batch_size', 'means', 'starts', '_start', '_sum', '_count')
+
+    def __init__(self, batch_size: int = 5):
+        self.batch_size = batch_size
+        self.means = array('d')
+        self.starts = array('d')
+        self._start = 0.0
+        self._sum = 0.0
+        self._count = 0
+
+    def add(self, time: float, value: float) -> None:
+        """Добавляет наблюдение value в момент time."""
+        if not self._count:
+            self._start = time
+        self._sum += value
+        self._count += 1
+        if self._count == self.batch_size:
+            self.means.append(self._sum / self.batch_size)
+            self.starts.append(self._start)
+            self._sum = 0.0
+            self._count = 0
+
+    def extend(self, times, values) -> None:
+        """Добавляет блок наблюдений в порядке их появления; полные группы считаются векторно."""
+        times = np.asarray(times, dtype=float)
+        values = np.asarray(values, dtype=float)
+        m = self.batch_size
+        i = 0
+        while self._count and i < values.size:
+            self.add(float(times[i]), float(values[i]))
+            i += 1
+        full = (values.size - i) // m
+        if full:
+            self.means.extend((values[i:i + full * m].reshape(full, m).sum(axis=1) / m).tolist())
+            self.starts.extend(times[i:i + full * m:m].tolist())
+            i += full * m
+        for j in range(i, values.size):
+            self.add(float(times[j]), float(values[j]))
+
+    def __len__(self):
+        return len(self.means)
+
+    def __repr__(self):
+        return f"BatchSeries(batches={len(self.means)}, batch_size={self.batch_size})"
+
+
+def mser_truncation(values, batch_size: int = 5) -> int:
+    """
+    Точка усечения разогрева по правилу MSER-m (по умолчанию MSER-5).
+    Ряд наблюдений в порядке их появления разбивается на средние Z групп по
+    batch_size, и выбирается число d отбрасываемых групп (не больше половины),
+    минимизирующее sum_{j>d} (Z_j - mean(Z_{d+1..k}))^2 / (k - d)^2.
+    Возвращает число отбрасываемых наблюдений (кратно batch_size). Готовые
+    средние групп (BatchSeries.means) передаются с batch_size=1.
+    """
+    values = np.asarray(values, dtype=float)
+    k = values.size // batch_size
+    if k < 4:
+        return 0
+    z = values[:k * batch_size].reshape(k, batch_size).mean(axis=1)
+    # Суммы хвостов Z_{d+1..k} и их квадратов для всех d сразу
+    tail_sum = np.cumsum(z[::-1])[::-1]
+    tail_sq = np.cumsum((z * z)[::-1])[::-1]
+    remaining = np.arange(k, 0, -1, dtype=float)
+    statistic = (tail_sq - tail_sum * tail_sum / remaining) / remaining ** 2
+    return int(np.argmin(statistic[:k // 2 + 1])) * batch_size
+
+
+def batch_means_interval(batch_values, confidence: float = 0.95) -> Dict[str, Any]:
+    """
+    Доверительный интервал среднего по средним k групп одного длинного запуска
+    (метод групповых средних) и автокорреляция соседних групп с лагом 1:
+    если она заметно больше нуля, группы слишком коротки и интервал занижен.
+    """
+    values = np.asarray(batch_values, dtype=float)
+    values = values[~np.isnan(values)]
+    series = RunningStats()
+    series.extend(values)
+    deviations = values - series.mean
+    denominator = float((deviations * deviations).sum())
+    lag1 = float((deviations[:-1] * deviations[1:]).sum()) / denominator if denominator > 0 else 0.0
+    return {
+        'mean': series.mean,
+        'half_width': series.half_width(confidence),
+        'lag1_autocorrelation': lag1,
+        'batches': series.count,
+    }
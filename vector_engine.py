@@ -0,0 +1,288 @@
+import heapq
+from typing import Dict, Any
+
+import numpy as np
+
+from airport_model import RandomStreams
+from streaming_stats import RunningStats, QuantileSketch
+
+# Размер окна векторной проверки "никто не ждет" на многоканальной станции
+WINDOW = 4096
+# Сколько пассажиров подряд должны пройти без ожидания, чтобы последовательный
+# расчет станции вернулся к векторной проверке
+RESUME_AFTER = 64
+
+
+def _draw_arrivals(model, rng: np.random.Generator) -> np.ndarray:
+    """Моменты появления пассажиров: начальные в момент 0, затем пуассоновский поток до конца моделирования."""
+    horizon = model.simulation_time
+    arrival_lambda = 1.0 / model.passenger_arrival_rate
+    expected = horizon * arrival_lambda
+    size = int(expected + 4 * expected ** 0.5) + 16
+
+    blocks = [np.zeros(model.initial_passengers)]
+    now = 0.0
+    while now < horizon:
+        # Накопление с начальным значением повторяет последовательное now += interarrival
+        block = np.cumsum(np.concatenate(([now], rng.standard_exponential(size) / arrival_lambda)))[1:]
+        blocks.append(block[block < horizon])
+        now = block[-1]
+    return np.concatenate(blocks)
+
+
+def _draw_services(model, streams: RandomStreams, n: int) -> np.ndarray:
+    """
+    Длительности обслуживания всех n пассажиров: матрица (n, число этапов),
+    NaN - этап пропускается. Формулы те же, что в make_passenger_sampler.
+    """
+    route = model.route
+    rng = {}
+
+    def generator(purpose):
+        if purpose not in rng:
+            rng[purpose] = np.random.default_rng(streams.seed_sequence(purpose))
+        return rng[purpose]
+
+    bags = np.floor(generator('bags').random(n) * 4)
+
+    visits = np.ones((n, len(route)), dtype=bool)
+    optional = [i for i, spec in enumerate(route) if spec.probability < 1]
+    if optional:
+        probabilities = np.array([route[i].probability for i in optional])
+        visits[:, optional] = generator('routing').random((n, len(optional))) < probabilities
+
+    # Этапы с общим потоком (toilet_before и toilet_after) берут значения
+    # по очереди в порядке пассажиров, как при розыгрыше пассажира целиком
+    groups = {}
+    for i, spec in enumerate(route):
+        groups.setdefault(spec.service_key, []).append(i)
+    uniforms = np.full((n, len(route)), np.nan)
+    for key, columns in groups.items():
+        mask = visits[:, columns]
+        block = np.full(mask.shape, np.nan)
+        block[mask] = generator(key).random(int(mask.sum()))
+        uniforms[:, columns] = block
+
+    services = np.empty((n, len(route)))
+    for i, spec in enumerate(route):
+        low, high = spec.service_time
+        services[:, i] = low + (high - low) * uniforms[:, i] + bags * spec.per_bag
+    return services
+
+
+def _lindley_starts(arrivals: np.ndarray, services: np.ndarray) -> np.ndarray:
+    """Начала обслуживания на одноканальной станции: рекуррентность Линдли через накопленный максимум."""
+    cumulative = np.cumsum(services)
+    departures = cumulative + np.maximum.accumulate(arrivals - (cumulative - services))
+    previous = np.concatenate(([-np.inf], departures[:-1]))
+    return np.maximum(arrivals, previous)
+
+
+def _no_wait_prefix(arrivals: np.ndarray, services: np.ndarray, release: np.ndarray) -> int:
+    """
+    Сколько первых пассажиров окна застают свободный канал. release - моменты
+    освобождения c каналов к началу окна. Пока число занятых в бесконечноканальной
+    системе не превышает c, станция ведет себя как бесконечноканальная и никто не ждет.
+    """
+    c = release.size
+    m = arrivals.size
+    times = np.concatenate((release, arrivals, arrivals + services))
+    # При равном времени освобождение обрабатывается раньше прибытия
+    kinds = np.concatenate((np.zeros(c), np.ones(m), np.zeros(m)))
+    deltas = np.concatenate((-np.ones(c), np.ones(m), -np.ones(m)))
+    order = np.lexsort((kinds, times))
+    overflow = (c + np.cumsum(deltas[order])) > c
+    if not overflow.any():
+        return m
+    return int(order[overflow.argmax()]) - c
+
+
+def _fcfs_starts(arrivals: np.ndarray, services: np.ndarray, c: int) -> np.ndarray:
+    """
+    Начала обслуживания на станции FCFS с c каналами для пассажиров,
+    упорядоченных по моменту прихода. Участки без ожидания считаются векторно
+    окнами по WINDOW пассажиров; участки с очередью - рекуррентностью
+    по куче моментов освобождения каналов, пока очередь не рассосется.
+    """
+    n = arrivals.size
+    if c >= n:
+        return arrivals.copy()
+    if c == 1:
+        return _lindley_starts(arrivals, services)
+
+    starts = np.empty(n)
+    release = np.full(c, -np.inf)
+    arrival_list = service_list = None
+    j = 0
+    while j < n:
+        end = min(n, j + WINDOW)
+        k = _no_wait_prefix(arrivals[j:end], services[j:end], release)
+        if k:
+            stop = j + k
+            starts[j:stop] = arrivals[j:stop]
+            release = np.sort(np.concatenate((release, arrivals[j:stop] + services[j:stop])))[-c:]
+            j = stop
+        if j == end:
+            continue
+
+        # Пассажир j ждет: последовательный расчет
+        if arrival_list is None:
+            arrival_list = arrivals.tolist()
+            service_list = services.tolist()
+        heap = release.tolist()  # отсортированный список - корректная куча
+        replace = heapq.heapreplace
+        first = j
+        queued = []
+        streak = 0
+        while j < n and streak < RESUME_AFTER:
+            arrival = arrival_list[j]
+            free_at = heap[0]
+            if arrival >= free_at:
+                start = arrival
+                streak += 1
+            else:
+                start = free_at
+                streak = 0
+            replace(heap, start + service_list[j])
+            queued.append(start)
+            j += 1
+        starts[first:j] = queued
+        release = np.sort(heap)
+    return starts
+
+
+def _slice_index(slices, times: np.ndarray) -> np.ndarray:
+    """Номера отрезков slices, на которые приходятся моменты times (не позже конца моделирования)."""
+    bounds = np.array(slices.bounds)
+    return np.minimum(np.searchsorted(bounds, times, side='right'), bounds.size - 1)
+
+
+def _by_slice(slices, times: np.ndarray, values: np.ndarray) -> tuple:
+    """
+    Значения values, сгруппированные по отрезкам своих моментов times (порядок
+    внутри отрезка сохраняется), и границы групп offsets: группа отрезка j -
+    values[offsets[j]:offsets[j + 1]], как ждут extend_groups накопителей.
+    """
+    index = _slice_index(slices, times)
+    order = np.argsort(index, kind='stable')
+    return values[order], np.searchsorted(index[order], np.arange(len(slices.parts) + 1))
+
+
+def _spread(slices, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """
+    Суммы длин пересечений интервалов [start, end] (end не позже конца
+    моделирования) с каждым отрезком slices - векторный RunSlices.spread.
+    Интервал, лежащий в одном отрезке, целиком относится к нему; у
+    пересекающих границы первый и последний отрезки получают свои части,
+    а промежуточные - свою полную длину.
+    """
+    lows = np.array(slices.starts)
+    highs = np.array(slices.bounds)
+    n = highs.size
+    positive = end > start
+    start, end = start[positive], end[positive]
+    first = np.minimum(np.searchsorted(highs, start, side='right'), n - 1)
+    last = np.minimum(np.searchsorted(highs, end, side='left'), n - 1)
+    inside = first == last
+    totals = np.bincount(first[inside], weights=end[inside] - start[inside], minlength=n)
+    crossing = ~inside
+    if crossing.any():
+        first, last = first[crossing], last[crossing]
+        totals += np.bincount(first, weights=highs[first] - start[crossing], minlength=n)
+        totals += np.bincount(last, weights=end[crossing] - lows[last], minlength=n)
+        # Отрезки строго между первым и последним покрыты интервалом целиком
+        covering = np.zeros(n + 1)
+        np.add.at(covering, first + 1, 1)
+        np.add.at(covering, last, -1)
+        totals += np.cumsum(covering)[:n] * (highs - lows)
+    return totals
+
+
+def _monitor_station(slices, name: str, arrivals: np.ndarray, starts: np.ndarray,
+                     ends: np.ndarray, horizon: float) -> None:
+    """Интегралы занятости и длины очереди станции и наибольшая очередь по отрезкам."""
+    begun = starts < horizon
+    arrived = arrivals < horizon
+    busy = _spread(slices, starts[begun], np.minimum(ends[begun], horizon))
+    queued = _spread(slices, arrivals[arrived], np.minimum(starts[arrived], horizon))
+    # Длина очереди = пришедшие - начавшие обслуживание; при равном времени начало учитывается раньше прихода
+    times = np.concatenate((starts[begun], arrivals[arrived]))
+    kinds = np.concatenate((np.zeros(int(begun.sum())), np.ones(int(arrived.sum()))))
+    order = np.lexsort((kinds, times))
+    times = times[order]
+    levels = np.cumsum(np.where(kinds[order] > 0, 1, -1))
+    peaks = np.zeros(len(slices.parts), dtype=np.int64)
+    np.maximum.at(peaks, _slice_index(slices, times), levels)
+    # Очередь в начале отрезка - уровень после последнего события до его начала
+    before = np.searchsorted(times, slices.starts, side='left') - 1
+    opening = np.where(before >= 0, levels[np.maximum(before, 0)], 0)
+    for j, run_stats in enumerate(slices.parts):
+        run_stats.busy_time[name] = float(busy[j])
+        run_stats.queue_time[name] = float(queued[j])
+        run_stats.max_queue[name] = max(0, int(opening[j]), int(peaks[j]))
+
+
+def run_vector(model, slices, seed: int = None, completions=None) -> Dict[str, Any]:
+    """
+    Векторный движок для режима без ухода по таймауту. Без ухода аэропорт -
+    открытая сеть без обратных связей из многоканальных станций FCFS, поэтому
+    все случайные величины разыгрываются заранее массивами, а моменты ухода
+    со станции получаются из моментов прихода на нее за один проход по
+    маршруту. Массивы берутся из тех же генераторов NumPy и в том же порядке,
+    что и значения буферов VariateBuffer у других движков, поэтому при одном
+    зерне результаты совпадают с ними с точностью до порядка суммирования.
+    slices и completions - как у fast_engine.run_fast (пассажиры передаются
+    в completions.extend одним блоком); диагностики движка нет.
+    """
+    if model.reneging:
+        raise ValueError("Векторный движок не поддерживает уход по таймауту: "
+                         "задайте 'reneging': false или max_time >= simulation_time")
+    resources = [spec.resource for spec in model.route]
+    if len(set(resources)) != len(resources):
+        raise ValueError("Векторный движок требует, чтобы каждый ресурс встречался в маршруте один раз")
+
+    if seed is None:
+        seed = model.params.get('seed')
+    streams = RandomStreams(seed)
+    horizon = model.simulation_time
+    parts = slices.parts
+
+    appeared = _draw_arrivals(model, np.random.default_rng(streams.seed_sequence('arrival')))
+    services = _draw_services(model, streams, appeared.size)
+
+    # ready - момент, когда пассажир закончил предыдущий этап
+    ready = appeared.copy()
+    for i, spec in enumerate(model.route):
+        visitors = np.flatnonzero(~np.isnan(services[:, i]))
+        order = visitors[np.argsort(ready[visitors], kind='stable')]
+        stage_services = services[order, i]
+        arrivals = ready[order]
+        starts = _fcfs_starts(arrivals, stage_services, model.resource_counts[spec.resource])
+        ends = starts + stage_services
+        finished = ends < horizon
+        begun = starts < horizon
+        stages = [run_stats.stages[i] for run_stats in parts]
+        durations, offsets = _by_slice(slices, ends[finished], ends[finished] - starts[finished])
+        RunningStats.extend_groups([stage.service for stage in stages], durations, offsets)
+        waits, offsets = _by_slice(slices, starts[begun], starts[begun] - arrivals[begun])
+        QuantileSketch.extend_groups([stage.queue_wait for stage in stages], waits, offsets)
+        for stage, started in zip(stages, np.diff(offsets).tolist()):
+            stage.started = started
+        _monitor_station(slices, spec.resource, arrivals, starts, ends, horizon)
+        ready[order] = ends
+
+    presence = _spread(slices, appeared, np.minimum(ready, horizon))
+    generated = np.bincount(_slice_index(slices, appeared), minlength=len(parts))
+    done = ready < horizon
+    if completions is not None:
+        by_time = np.flatnonzero(done)[np.argsort(ready[done], kind='stable')]
+        completions.extend(ready[by_time], ready[by_time] - appeared[by_time])
+    sojourns, offsets = _by_slice(slices, ready[done], ready[done] - appeared[done])
+    RunningStats.extend_groups([run_stats.wait_stats for run_stats in parts], sojourns, offsets)
+    QuantileSketch.extend_groups([run_stats.wait_sketch for run_stats in parts], sojourns, offsets)
+    served = np.diff(offsets)
+    for j, run_stats in enumerate(parts):
+        run_stats.presence_time = float(presence[j])
+        run_stats.total_generated_passengers = int(generated[j])
+        run_stats.served_passengers = int(served[j])
+    return {}